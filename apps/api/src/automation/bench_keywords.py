@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Keyword Matcher Micro-Benchmark
+Compares the compiled keyword matcher with the previous per-call
+keyword lists and any(keyword in text) scans
+
+Usage: python bench_keywords.py [--docs 2000] [--repeat 5] [--seed 42]
+"""
+
+import argparse
+import random
+import timeit
+
+from keyword_matcher import get_matcher, load_matcher
+
+def legacy_keyword_tier(text: str):
+    """Keyword stage of detect_priority before the compiled matcher"""
+    critical_keywords = [
+        'urgent', 'critical', 'emergency', 'down', 'failure', 'broken', 
+        'crash', 'outage', 'immediate', 'catastrophic', 'production down',
+        'system down', 'server down', 'database down', 'major outage'
+    ]
+    if any(keyword in text for keyword in critical_keywords):
+        return 'critical'
+    high_keywords = [
+        'severe', 'major', 'stop working', 'cannot access', 'security breach',
+        'data loss', 'performance issue', 'high priority', 'escalate'
+    ]
+    if any(keyword in text for keyword in high_keywords):
+        return 'high'
+    medium_keywords = [
+        'error', 'bug', 'issue', 'problem', 'slow', 'not working', 
+        'login', 'password', 'access denied', 'timeout', 'warning'
+    ]
+    if any(keyword in text for keyword in medium_keywords):
+        return 'medium'
+    return None
+
+FILLER = (
+    "hello team thanks for the update could you please check the invoice attached "
+    "regarding our account we would like to schedule a call next week about the "
+    "renewal and the new billing portal kind regards customer success"
+).split()
+KEYWORDS = ["urgent", "server down", "major", "data loss", "error", "timeout", "slow", "outage"]
+
+def make_corpus(docs: int, seed: int):
+    """Seeded mix of short/long texts with and without keyword hits"""
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(docs):
+        words = [rng.choice(FILLER) for _ in range(rng.choice([15, 60, 400, 2000]))]
+        if i % 3 == 0:
+            words.insert(rng.randrange(len(words)), rng.choice(KEYWORDS))
+        corpus.append(" ".join(words).lower())
+    return corpus
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    
+    corpus = make_corpus(args.docs, args.seed)
+    matcher = get_matcher()
+    
+    compile_time = timeit.timeit(load_matcher, number=1)
+    legacy = min(timeit.repeat(lambda: [legacy_keyword_tier(t) for t in corpus], number=1, repeat=args.repeat))
+    compiled = min(timeit.repeat(lambda: [matcher.match(t) for t in corpus], number=1, repeat=args.repeat))
+    
+    # Differences are expected where word boundaries apply ("down" inside "download")
+    disagreements = sum(1 for t in corpus if legacy_keyword_tier(t) != matcher.match(t))
+    
+    print(f"docs: {len(corpus)} | avg chars: {sum(map(len, corpus)) / len(corpus):.0f} | keyword config {matcher.version}")
+    print(f"compile:  {compile_time * 1e3:8.2f} ms (once per config version)")
+    print(f"legacy:   {legacy / len(corpus) * 1e6:8.2f} us/doc")
+    print(f"compiled: {compiled / len(corpus) * 1e6:8.2f} us/doc  ({legacy / compiled:.2f}x)")
+    print(f"tier disagreements: {disagreements} (word-boundary matching)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Priority Classifier Benchmark
+Measures per-document detect_priority latency, full processing cycle
+throughput, peak memory and bytes fetched per batch on a seeded synthetic
+corpus, with MongoDB and Redis replaced by mongomock and fakeredis.
+Compares throughput with a stored baseline and exits non-zero on a regression.
+
+Usage: python benchmark.py [--docs 1000] [--seed 42] [--batch-size 10] [--repeat 3]
+                           [--baseline benchmark_baseline.json] [--threshold 0.2]
+                           [--save-baseline]
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# -----------------------------
+# 1. Synthetic Corpus
+# -----------------------------
+FILLER = (
+    "hello team thanks for the update could you please check the invoice attached "
+    "regarding our account we would like to schedule a call next week about the "
+    "renewal and the new billing portal kind regards customer success"
+).split()
+KEYWORDS = ["urgent", "server down", "major", "data loss", "error", "timeout", "slow", "outage"]
+NEGATIVE = ["terrible", "awful", "disappointed", "useless", "horrible", "unacceptable", "frustrating"]
+POSITIVE = ["great", "wonderful", "excellent", "happy", "helpful", "amazing", "pleased"]
+NON_ASCII = ["café", "naïve", "größe", "déjà vu", "こんにちは", "спасибо", "😀", "señor", "Ærøskøbing"]
+
+CASES = ["keyword", "negative", "positive", "empty", "long", "non_ascii"]
+
+def make_corpus(docs: int, seed: int):
+    """Seeded (case, subject, body) documents, cycling through every case"""
+    rng = random.Random(seed)
+
+    def words(count, extra=()):
+        out = [rng.choice(FILLER) for _ in range(count)]
+        for word in extra:
+            out.insert(rng.randrange(len(out) + 1), word)
+        return " ".join(out)
+
+    corpus = []
+    for i in range(docs):
+        case = CASES[i % len(CASES)]
+        # Reference numbers keep texts distinct so the classification cache stays cold
+        ref = f"ref {seed}-{i}"
+        if case == "keyword":
+            subject, body = f"{rng.choice(KEYWORDS)} {ref}", words(40)
+        elif case == "negative":
+            subject, body = f"feedback {ref}", words(30, rng.sample(NEGATIVE, 3))
+        elif case == "positive":
+            subject, body = f"thanks {ref}", words(30, rng.sample(POSITIVE, 3))
+        elif case == "empty":
+            subject, body = "", ""
+        elif case == "long":
+            subject, body = f"report {ref}", words(4000, rng.sample(NEGATIVE + POSITIVE, 4))
+        else:
+            subject, body = f"{rng.choice(NON_ASCII)} {ref}", words(30, rng.sample(NON_ASCII, 4))
+        corpus.append((case, subject, body))
+    return corpus
+
+# -----------------------------
+# 2. Worker With Local Stand-ins
+# -----------------------------
+def add_substr_cp(mongomock):
+    """mongomock lacks $substrCP, which the worker's fetch projection uses; its $substr already counts code points"""
+    parser = mongomock.aggregate._Parser
+    handle_string_operator = parser._handle_string_operator
+
+    def handle(self, operator, values):
+        if operator != "$substrCP":
+            return handle_string_operator(self, operator, values)
+        try:
+            string = self.parse(values[0])
+        except KeyError:
+            return ""
+        start, length = self.parse(values[1]), self.parse(values[2])
+        return string[start:start + length] if isinstance(string, str) else ""
+
+    parser._handle_string_operator = handle
+
+def load_worker(batch_size: int):
+    """Import email_worker against mongomock and fakeredis"""
+    try:
+        import mongomock
+        import fakeredis
+    except ImportError as e:
+        sys.exit(f"benchmark needs mongomock and fakeredis: {e}")
+    import pymongo
+    import redis
+    import logging
+
+    os.environ["EMAIL_WORKER_BATCH_SIZE"] = str(batch_size)
+    os.environ.setdefault("EMAIL_WORKER_METRICS_PORT", "0")
+    pymongo.MongoClient = mongomock.MongoClient
+    add_substr_cp(mongomock)
+    redis.Redis = fakeredis.FakeRedis
+
+    import email_worker
+    email_worker.init_connections()
+    # Per-document INFO lines would dominate the measurement
+    logging.getLogger().setLevel(logging.WARNING)
+    return email_worker
+
+def reset_cache(worker):
+    """Empty both classification cache tiers"""
+    from classification_cache import ClassificationCache
+    worker.redis_client.flushdb()
+    worker.classification_cache = ClassificationCache(worker.redis_client)
+
+def percentile(sorted_values, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+# -----------------------------
+# 3. Measurements
+# -----------------------------
+def bench_detect(worker, corpus):
+    """Per-document detect_priority latency with a cold cache"""
+    reset_cache(worker)
+    worker.detect_priority("warm up", "load the sentiment engine")
+    reset_cache(worker)
+
+    latencies = {case: [] for case in CASES}
+    start_time = time.perf_counter()
+    for case, subject, body in corpus:
+        doc_start = time.perf_counter()
+        worker.detect_priority(subject, body)
+        latencies[case].append(time.perf_counter() - doc_start)
+    elapsed = time.perf_counter() - start_time
+
+    return latencies, len(corpus) / elapsed
+
+def bench_cycle(worker, corpus):
+    """Emails and tickets processed per second by back-to-back processing cycles"""
+    reset_cache(worker)
+    worker.emails_col.delete_many({})
+    worker.tickets_col.delete_many({})
+
+    created_at = datetime.utcnow() - timedelta(hours=1)
+    worker.emails_col.insert_many([
+        {"subject": subject, "body": body, "from": f"user{i % 50}@example.com", "priority": "pending",
+         "sentiment_analyzed": False, "createdAt": created_at}
+        for i, (_, subject, body) in enumerate(corpus)
+    ])
+    worker.tickets_col.insert_many([
+        {"title": subject, "detail": body, "email": f"user{i % 50}@example.com", "priority": "pending",
+         "sentiment_analyzed": False, "createdAt": created_at}
+        for i, (_, subject, body) in enumerate(corpus)
+    ])
+    total = 2 * len(corpus)
+
+    # Whole cycles as the worker runs them: lag split, both claims, classification and writes
+    start_time = time.perf_counter()
+    cycles = 0
+    while worker.process_all_pending():
+        cycles += 1
+        if cycles > total:
+            sys.exit("processing cycle made no progress")
+    elapsed = time.perf_counter() - start_time
+    if worker.emails_col.count_documents({"priority": "pending"}) or \
+            worker.tickets_col.count_documents({"priority": "pending"}):
+        sys.exit("processing cycles left documents pending")
+
+    return total / elapsed, cycles
+
+def bench_memory(worker, corpus):
+    """Peak traced Python allocations over one detect pass (MiB)"""
+    reset_cache(worker)
+    tracemalloc.start()
+    for _, subject, body in corpus:
+        worker.detect_priority(subject, body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / (1024 * 1024)
+
+def bench_fetch(worker, corpus, batch_size: int):
+    """
+    Bytes returned and Python memory held for one batch of the longest
+    emails: full documents as dicts vs server-truncated compact records (KiB)
+    """
+    import bson
+
+    worker.emails_col.delete_many({})
+    long_docs = [(subject, body) for case, subject, body in corpus if case == "long"][:batch_size]
+    ids = worker.emails_col.insert_many([
+        {"subject": subject, "body": body, "from": "user@example.com", "priority": "pending",
+         "sentiment_analyzed": False, "createdAt": datetime.utcnow()}
+        for subject, body in long_docs
+    ]).inserted_ids
+    match = {"_id": {"$in": ids}}
+    # What crosses the wire, as pymongo would receive it
+    full = [bson.encode(doc) for doc in worker.emails_col.find(match, worker.EmailRecord.projection())]
+    truncated = [bson.encode(doc) for doc in worker.emails_col.aggregate(
+        [{"$match": match}, worker.EmailRecord.project_stage()]
+    )]
+    worker.emails_col.delete_many({})
+
+    def held(materialize):
+        tracemalloc.start()
+        docs = materialize()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del docs
+        return size / 1024
+
+    full_held = held(lambda: [bson.decode(raw) for raw in full])
+    record_held = held(lambda: [worker.EmailRecord(bson.decode(raw)) for raw in truncated])
+    return sum(map(len, full)) / 1024, sum(map(len, truncated)) / 1024, full_held, record_held
+
+IMPORT_PROBE = "import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+
+def bench_import(module: str, repeat: int) -> float:
+    """Fastest cold import of a module in a fresh interpreter (ms)"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    timings = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", IMPORT_PROBE.format(module=module)], cwd=here,
+                                capture_output=True, text=True, check=True).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return min(timings) * 1e3
+
+def max_rss_mib() -> float:
+    if resource is None:
+        return 0.0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return rss / (1024 * 1024) if platform.system() == "Darwin" else rss / 1024
+
+# -----------------------------
+# 4. Baseline
+# -----------------------------
+TRACKED = ["detect_docs_per_sec", "cycle_docs_per_sec"]
+# Higher is worse for these
+TRACKED_COSTS = ["import_classifier_ms", "import_email_worker_ms"]
+
+def compare_baseline(results, baseline, threshold: float) -> bool:
+    """Print the throughput change against the baseline; False on a regression"""
+    if baseline.get("docs") != results["docs"] or baseline.get("seed") != results["seed"]:
+        print(f"note: baseline was recorded with docs={baseline.get('docs')} seed={baseline.get('seed')}")
+
+    ok = True
+    for name in TRACKED:
+        before = baseline.get(name)
+        if not before:
+            continue
+        change = results[name] / before - 1
+        regressed = change < -threshold
+        ok = ok and not regressed
+        print(f"{name}: {before:.1f} -> {results[name]:.1f} ({change:+.1%}){'  REGRESSION' if regressed else ''}")
+    for name in TRACKED_COSTS:
+        before = baseline.get(name)
+        if not before:
+            continue
+        change = results[name] / before - 1
+        # Imports of a few milliseconds jitter by more than the threshold; allow 5 ms either way
+        regressed = change > threshold and results[name] - before > 5
+        ok = ok and not regressed
+        print(f"{name}: {before:.1f} -> {results[name]:.1f} ({change:+.1%}){'  REGRESSION' if regressed else ''}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement; the fastest is kept")
+    parser.add_argument("--baseline", default="benchmark_baseline.json")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed throughput drop against the baseline (0.2 = 20%%)")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    args = parser.parse_args()
+
+    # Measured in fresh interpreters before anything here imports the modules
+    import_classifier = bench_import("classifier", args.repeat)
+    import_worker = bench_import("email_worker", args.repeat)
+
+    worker = load_worker(args.batch_size)
+    corpus = make_corpus(args.docs, args.seed)
+
+    # Best of several runs keeps scheduler noise out of the baseline comparison
+    latencies, detect_rate = max((bench_detect(worker, corpus) for _ in range(args.repeat)), key=lambda run: run[1])
+    cycle_rate, cycles = max(bench_cycle(worker, corpus) for _ in range(args.repeat))
+    peak_mib = bench_memory(worker, corpus)
+    full_kib, record_kib, full_held_kib, record_held_kib = bench_fetch(worker, corpus, args.batch_size)
+
+    all_latencies = sorted(value for values in latencies.values() for value in values)
+    results = {
+        "docs": args.docs,
+        "seed": args.seed,
+        "batch_size": args.batch_size,
+        "repeat": args.repeat,
+        "detect_docs_per_sec": detect_rate,
+        "cycle_docs_per_sec": cycle_rate,
+        "p50_ms": percentile(all_latencies, 0.50) * 1e3,
+        "p95_ms": percentile(all_latencies, 0.95) * 1e3,
+        "p99_ms": percentile(all_latencies, 0.99) * 1e3,
+        "import_classifier_ms": import_classifier,
+        "import_email_worker_ms": import_worker,
+        "peak_traced_mib": peak_mib,
+        "max_rss_mib": max_rss_mib(),
+        "fetch_full_kib": full_kib,
+        "fetch_records_kib": record_kib,
+        "held_dicts_kib": full_held_kib,
+        "held_records_kib": record_held_kib,
+        "python": platform.python_version(),
+        "recorded_at": datetime.utcnow().isoformat(timespec="seconds"),
+    }
+
+    print(f"docs: {args.docs} | seed: {args.seed} | batch size: {args.batch_size} | "
+          f"sentiment engine: {worker.SENTIMENT_ENGINE}")
+    print(f"{'case':<10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for case in CASES:
+        values = sorted(latencies[case])
+        print(f"{case:<10} {percentile(values, 0.50) * 1e3:9.3f} {percentile(values, 0.95) * 1e3:9.3f} "
+              f"{percentile(values, 0.99) * 1e3:9.3f}")
+    print(f"{'all':<10} {results['p50_ms']:9.3f} {results['p95_ms']:9.3f} {results['p99_ms']:9.3f}")
+    print(f"detect_priority: {detect_rate:.1f} docs/sec (cold cache)")
+    print(f"processing cycle: {cycle_rate:.1f} docs/sec over {cycles} cycles")
+    print(f"import: classifier {import_classifier:.1f} ms | email_worker {import_worker:.1f} ms")
+    print(f"memory: peak traced {peak_mib:.1f} MiB | max RSS {results['max_rss_mib']:.1f} MiB")
+    print(f"fetch per batch of long emails: {full_kib:.1f} KiB full -> {record_kib:.1f} KiB truncated | "
+          f"held {full_held_kib:.1f} KiB as dicts -> {record_held_kib:.1f} KiB as records")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline} (run with --save-baseline to record one)")
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    return 0 if compare_baseline(results, baseline, args.threshold) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
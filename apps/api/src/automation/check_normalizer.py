@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Body Normalizer Check
+Runs normalize_body over fixed bodies with known newest-message text,
+including message text that only looks like a reply header
+
+Usage: python check_normalizer.py
+Exits with status 1 when any case does not normalize as expected
+"""
+
+import sys
+
+from text_normalizer import normalize_body
+
+CASES = [
+    # Reply headers and signatures end the message
+    ("Server is down again\n\nOn Mon, Jan 8, 2024 at 9:12 AM Support <support@example.com> wrote:\n> Fixed",
+     "Server is down again"),
+    ("Still broken\nFrom: Support Team\nSent: Monday, January 8, 2024 9:12 AM\nTo: Me\nSubject: Re: outage",
+     "Still broken"),
+    ("Still broken\nFrom: Support Team\nDate: Mon, 8 Jan 2024\n\nOld text",
+     "Still broken"),
+    ("Please check\n-----Original Message-----\nolder text", "Please check"),
+    ("Login fails\nKind regards,\nJane", "Login fails"),
+    ("Thanks!", "Thanks!"),
+    # Message text that starts like a header is kept
+    ("Hi,\nOn the server I restarted, the job I wrote\nstill fails with error 500",
+     "Hi, On the server I restarted, the job I wrote still fails with error 500"),
+    ("Hello\nFrom: the monitoring dashboard we see errors",
+     "Hello From: the monitoring dashboard we see errors"),
+    ("Hello\nFrom: the monitoring dashboard we see errors\nsince this morning",
+     "Hello From: the monitoring dashboard we see errors since this morning"),
+    # HTML bodies drop markup and quoted blocks
+    ("<div>Payment page crashes</div><blockquote>old</blockquote>", "Payment page crashes"),
+]
+
+def main():
+    failures = 0
+    for body, expected in CASES:
+        actual = normalize_body(body)
+        if actual != expected:
+            failures += 1
+            print(f"FAIL {body!r}\n  expected {expected!r}\n  got      {actual!r}")
+    print(f"{len(CASES) - failures}/{len(CASES)} cases passed")
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
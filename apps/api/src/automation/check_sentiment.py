@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Lexicon Engine Agreement Check
+Scores a fixed seeded corpus with the lexicon and textblob engines and
+compares the resulting priorities, without and with the tolerance band
+
+Usage: python check_sentiment.py [--docs 2000] [--seed 42] [--tolerance 0.05] [--show 10]
+Exits with status 1 when the banded lexicon engine disagrees on more than
+--max-disagreements documents
+"""
+
+import argparse
+import random
+import sys
+
+from sentiment import LexiconEngine, TextBlobEngine, priority_from_sentiment
+
+FILLER = (
+    "hello team thanks for the update could you please check the invoice attached "
+    "regarding our account we would like to schedule a call next week about the "
+    "renewal and the new billing portal kind regards"
+).split()
+ASSESSMENTS = [
+    "good", "bad", "great", "terrible", "slow", "broken", "happy", "unhappy",
+    "awful", "helpful", "disappointed", "frustrating", "excellent", "poor", "wrong"
+]
+MODIFIERS = [
+    "very", "really", "extremely", "quite", "terribly", "not", "never", "not very",
+    "isn't", "is not a", "really not", "not really very", "very very"
+]
+# Tokenizer edge cases the lexicon engine does not model
+EXTRAS = [":(", ":-)", "!!!", "?", "...", ",", "e-mail", "re:", "100%"]
+
+def make_corpus(docs: int, seed: int):
+    """Seeded texts mixing filler with negated, modified, boosted and punctuated assessments"""
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(docs):
+        words = [rng.choice(FILLER) for _ in range(rng.choice([8, 25, 80]))]
+        for _ in range(rng.randint(1, 4)):
+            phrase = rng.choice(ASSESSMENTS)
+            if rng.random() < 0.5:
+                phrase = f"{rng.choice(MODIFIERS)} {phrase}"
+            if rng.random() < 0.2:
+                phrase += " !"
+            if rng.random() < 0.1:
+                phrase += rng.choice(["", " "]) + rng.choice(EXTRAS)
+            words.insert(rng.randrange(len(words) + 1), phrase)
+        corpus.append(" ".join(words).lower())
+    return corpus
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--tolerance", type=float, default=0.05)
+    parser.add_argument("--show", type=int, default=10, help="disagreeing texts to print")
+    parser.add_argument("--max-disagreements", type=int, default=None)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.docs, args.seed)
+    reference = TextBlobEngine().score_batch(corpus)
+    raw = LexiconEngine(tolerance=0.0).score_batch(corpus)
+    banded = LexiconEngine(tolerance=args.tolerance).score_batch(corpus)
+
+    expected = [priority_from_sentiment(*score) for score in reference]
+    raw_mismatch = [i for i, score in enumerate(raw) if priority_from_sentiment(*score) != expected[i]]
+    mismatch = [i for i, score in enumerate(banded) if priority_from_sentiment(*score) != expected[i]]
+    rescored = sum(1 for before, after in zip(raw, banded) if before != after)
+    errors = sorted(abs(score[0] - ref[0]) for score, ref in zip(raw, reference))
+
+    print(f"docs: {len(corpus)} | seed {args.seed} | tolerance {args.tolerance}")
+    print(f"polarity error: max {errors[-1]:.4f} | p99 {errors[int(len(errors) * 0.99)]:.4f} | over band {sum(e >= args.tolerance for e in errors)}")
+    print(f"priority disagreements without band: {len(raw_mismatch)}")
+    print(f"priority disagreements with band:    {len(mismatch)} ({rescored} rescored with textblob)")
+    for i in mismatch[:args.show]:
+        print(f"  lexicon {raw[i][0]:+.3f} textblob {reference[i][0]:+.3f} "
+              f"{priority_from_sentiment(*banded[i])}/{expected[i]}: {corpus[i][:100]}")
+
+    if args.max_disagreements is not None and len(mismatch) > args.max_disagreements:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
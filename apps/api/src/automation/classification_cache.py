@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Classification Cache
+Two-tier memo of priorities keyed by a hash of the normalized text:
+a bounded in-process LRU with TTL in front of Redis. Keys embed the
+classifier config version, so changing keyword tiers or thresholds
+never serves a stale priority.
+"""
+
+import os
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Dict, Iterable
+
+logger = logging.getLogger(__name__)
+
+CACHE_SIZE = int(os.environ.get("EMAIL_WORKER_CACHE_SIZE", "10000"))
+CACHE_TTL = int(os.environ.get("EMAIL_WORKER_CACHE_TTL", "3600"))
+REDIS_CACHE_TTL = int(os.environ.get("EMAIL_WORKER_REDIS_CACHE_TTL", "86400"))
+
+def content_key(text: str) -> str:
+    """Hash of lowercased text with whitespace collapsed"""
+    normalized = " ".join(text.split())
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).hexdigest()
+
+class ClassificationCache:
+    """In-process LRU (first tier) backed by Redis (second tier)"""
+
+    def __init__(self, redis_client=None, max_entries: int = CACHE_SIZE, ttl: int = CACHE_TTL,
+                 redis_ttl: int = REDIS_CACHE_TTL):
+        self.redis_client = redis_client
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.redis_ttl = redis_ttl
+        self.version = None
+        # key -> (expires_at, priority), oldest first
+        self.entries = OrderedDict()
+        self.hits_local = 0
+        self.hits_redis = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def set_version(self, version: str):
+        """Drop every local entry when the classifier config version changes"""
+        if version != self.version:
+            if self.version is not None:
+                logger.info(f"Classifier config changed ({self.version} -> {version}), cache invalidated")
+                self.evictions += len(self.entries)
+                self.entries.clear()
+            self.version = version
+
+    def redis_key(self, key: str) -> str:
+        return f"priority_hash:{self.version}:{key}"
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, str]:
+        """Return cached priorities for the keys that are found in either tier"""
+        found = {}
+        missing = []
+        now = time.monotonic()
+        
+        for key in dict.fromkeys(keys):
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(key)
+                found[key] = entry[1]
+                self.hits_local += 1
+                continue
+            if entry is not None:
+                del self.entries[key]
+                self.evictions += 1
+            missing.append(key)
+        
+        if missing and self.redis_client:
+            try:
+                values = self.redis_client.mget([self.redis_key(key) for key in missing])
+                for key, value in zip(missing, values):
+                    if value is not None:
+                        found[key] = value
+                        self._remember(key, value, now)
+                        self.hits_redis += 1
+            except Exception as cache_err:
+                logger.debug(f"Redis cache lookup skipped: {cache_err}")
+        
+        self.misses += sum(1 for key in missing if key not in found)
+        return found
+
+    def put_many(self, items: Dict[str, str]):
+        """Store freshly classified priorities in both tiers"""
+        if not items:
+            return
+        now = time.monotonic()
+        for key, priority in items.items():
+            self._remember(key, priority, now)
+        
+        if self.redis_client:
+            try:
+                pipe = self.redis_client.pipeline(transaction=False)
+                for key, priority in items.items():
+                    pipe.setex(self.redis_key(key), self.redis_ttl, priority)
+                pipe.execute()
+            except Exception as cache_err:
+                logger.debug(f"Redis cache store skipped: {cache_err}")
+
+    def _remember(self, key: str, priority: str, now: float):
+        if self.max_entries <= 0:
+            return
+        self.entries[key] = (now + self.ttl, priority)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> str:
+        """Counters for the health check log line"""
+        return (f"Cache L1:{self.hits_local} L2:{self.hits_redis} Miss:{self.misses} "
+                f"Evict:{self.evictions} Size:{len(self.entries)}")
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Priority Classifier Core
+Keyword tiers plus sentiment scoring for already lowercased texts.
+Holds no database, cache or logging setup so classification pool
+processes can import it on their own.
+"""
+
+import os
+import time
+import logging
+from typing import List, Optional, Tuple
+
+from keyword_matcher import get_matcher
+from sentiment import get_engine, priority_from_sentiment, SENTIMENT_ENGINE, THRESHOLDS_VERSION
+
+logger = logging.getLogger(__name__)
+
+_engine = None
+
+def get_sentiment_engine():
+    """Create the configured sentiment engine on first use"""
+    global _engine
+    if _engine is None:
+        _engine = get_engine()
+    return _engine
+
+def classifier_version() -> str:
+    """Keyword config, engine and thresholds that a classification depends on"""
+    return f"{get_matcher().version}.{SENTIMENT_ENGINE}.{THRESHOLDS_VERSION}"
+
+# Per-document sentiment budget in the worker's sentiment lane; 0 disables it
+SENTIMENT_BUDGET_MS = float(os.environ.get("EMAIL_WORKER_SENTIMENT_BUDGET_MS", "50"))
+# Texts per engine call in the sentiment lane; the lane deadline is checked between calls
+SENTIMENT_CHUNK = 16
+# Starting estimate of sentiment cost (TextBlob is ~1.3us/char), refined from every chunk
+_seconds_per_char = 2e-6
+
+def classify_texts(texts: List[str]) -> List[Optional[str]]:
+    """
+    Classify lowercased, non-empty texts with keywords first, then one
+    sentiment engine call for every text without a keyword hit.
+    Returns the priority per text, or None where sentiment scoring failed.
+    """
+    return classify_texts_timed(texts)[0]
+
+def classify_texts_timed(texts: List[str]) -> Tuple[List[Optional[str]], float, float]:
+    """classify_texts, plus the seconds spent on keywords and on sentiment"""
+    start_time = time.perf_counter()
+    priorities = match_keywords(texts)
+    keyword_seconds = time.perf_counter() - start_time
+    
+    sentiment_indexes = [i for i, priority in enumerate(priorities) if priority is None]
+    if not sentiment_indexes:
+        return priorities, keyword_seconds, 0.0
+    
+    scored, _, sentiment_seconds = score_texts_timed([texts[i] for i in sentiment_indexes], budget=0)
+    for i, priority in zip(sentiment_indexes, scored):
+        priorities[i] = priority
+    return priorities, keyword_seconds, sentiment_seconds
+
+def match_keywords(texts: List[str]) -> List[Optional[str]]:
+    """Keyword tier per text, or None where no keyword matches"""
+    # Per-text debug lines are only formatted when someone reads them
+    debug = logger.isEnabledFor(logging.DEBUG)
+    # Keyword tiers (critical > high > medium), compiled once and hot-reloaded
+    matcher = get_matcher()
+    tiers = []
+    for text in texts:
+        keyword_tier = matcher.match(text)
+        if keyword_tier and debug:
+            logger.debug(f"{keyword_tier.upper()} priority detected by keywords: {text[:50]}...")
+        tiers.append(keyword_tier)
+    return tiers
+
+def score_texts_timed(texts: List[str], budget: float = SENTIMENT_BUDGET_MS / 1000,
+                      defer: bool = True) -> Tuple[List[Optional[str]], List[str], float]:
+    """
+    Sentiment lane: priority and outcome per text, plus the seconds spent.
+
+    With a budget (seconds per text), a text predicted to take longer is
+    scored on its head only ('degraded'), and once the lane has used its
+    budget for the whole batch the texts not reached yet are 'deferred'
+    (None) when `defer` is set. The first chunk always runs, so deferred
+    texts make progress when they come back first in the next batch.
+    Other outcomes are 'scored' and 'failed' (None).
+    """
+    global _seconds_per_char
+    start_time = time.perf_counter()
+    debug = logger.isEnabledFor(logging.DEBUG)
+    engine = get_sentiment_engine()
+    priorities = [None] * len(texts)
+    outcomes = ['deferred'] * len(texts)
+    deadline = start_time + budget * len(texts) if budget > 0 and defer else None
+    # Longest text that fits the budget at the current cost estimate
+    max_chars = int(budget / _seconds_per_char) if budget > 0 else None
+    
+    for offset in range(0, len(texts), SENTIMENT_CHUNK):
+        if deadline is not None and offset and time.perf_counter() >= deadline:
+            break
+        chunk = texts[offset:offset + SENTIMENT_CHUNK]
+        degraded = [max_chars is not None and len(text) > max_chars for text in chunk]
+        if any(degraded):
+            chunk = [text[:max_chars] if cut else text for text, cut in zip(chunk, degraded)]
+        
+        chunk_start = time.perf_counter()
+        scores = _score_batch(engine, chunk)
+        chunk_chars = sum(len(text) for text in chunk)
+        if chunk_chars:
+            observed = (time.perf_counter() - chunk_start) / chunk_chars
+            _seconds_per_char = 0.8 * _seconds_per_char + 0.2 * observed
+        
+        for j, (score, cut) in enumerate(zip(scores, degraded)):
+            i = offset + j
+            if score is None:
+                outcomes[i] = 'failed'
+                continue
+            polarity, subjectivity = score
+            priorities[i] = priority_from_sentiment(polarity, subjectivity)
+            outcomes[i] = 'degraded' if cut else 'scored'
+            if debug:
+                logger.debug(f"Sentiment analysis - Polarity: {polarity:.3f}, Subjectivity: {subjectivity:.3f} "
+                             f"-> {priorities[i].upper()}")
+    
+    return priorities, outcomes, time.perf_counter() - start_time
+
+def _score_batch(engine, texts: List[str]) -> List[Optional[Tuple[float, float]]]:
+    """Engine scores for a batch, retrying one by one when the batch call fails"""
+    try:
+        return engine.score_batch(texts)
+    except Exception as e:
+        logger.warning(f"Batch sentiment analysis failed: {e}, retrying documents one by one")
+    scores = []
+    for text in texts:
+        try:
+            scores.extend(engine.score_batch([text]))
+        except Exception as doc_error:
+            logger.warning(f"Sentiment analysis failed: {doc_error}, defaulting to low")
+            scores.append(None)
+    return scores
+
+def warm_up() -> int:
+    """Pool initializer: compile keywords and load the sentiment engine once per process"""
+    get_matcher()
+    get_sentiment_engine().score_batch(["warm up the sentiment lexicon"])
+    return os.getpid()
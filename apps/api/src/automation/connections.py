@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Connection Factories
+MongoDB and Redis clients for the worker and the command line tools.
+Nothing connects at import time; each factory is called explicitly.
+"""
+
+import os
+import logging
+
+import pymongo
+
+logger = logging.getLogger(__name__)
+
+MONGO_URI = os.environ.get("EMAIL_WORKER_MONGO_URI", "mongodb://localhost:27017/peppermint")
+MONGO_DB = os.environ.get("EMAIL_WORKER_MONGO_DB", "peppermint")
+REDIS_URL = os.environ.get("EMAIL_WORKER_REDIS_URL", "redis://localhost:6379/0")
+
+def connect_mongo(uri: str = MONGO_URI, db_name: str = MONGO_DB):
+    """Return (client, database); raises when the server cannot be reached"""
+    client = pymongo.MongoClient(uri)
+    # MongoClient connects lazily; fail here rather than on the first query
+    client.admin.command("ping")
+    return client, client[db_name]
+
+def connect_redis(url: str = REDIS_URL):
+    """Return a Redis client, or None when Redis is unavailable"""
+    try:
+        # redis-py pulls in its asyncio client; only pay for it when connecting
+        import redis
+        client = redis.Redis.from_url(url, decode_responses=True)
+        client.ping()
+        return client
+    except Exception as e:
+        logger.warning(f"Failed to connect to Redis: {e} (continuing without caching)")
+        return None
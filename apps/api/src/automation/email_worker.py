@@ -8,15 +8,35 @@ Processes pending emails and tickets using NLP sentiment analysis
 import sys
 import io
 import os
+import re
 import pymongo
-from datetime import datetime
+from pymongo import UpdateOne, ReturnDocument
+from pymongo.errors import BulkWriteError
+from bson import ObjectId
+from datetime import datetime, timedelta
 import schedule
 import time
-from textblob import TextBlob
-import redis
+import zlib
+import socket
 import logging
-from typing import Dict, Any
+import threading
+import multiprocessing
+from typing import Dict, Any, List, Optional, Tuple
 import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import classifier
+import indexes
+import worker_logging
+from worker_logging import sample_document
+from connections import connect_mongo, connect_redis
+import metrics
+from pipeline import Pipeline, Stage
+from profiler import CycleProfiler
+from sentiment import SENTIMENT_ENGINE
+from classification_cache import ClassificationCache, content_key
+from text_normalizer import normalize_body, MAX_BODY_CHARS, HTML_SCAN_FACTOR
 
 # -----------------------------
 # 0. Windows Unicode Fix
@@ -35,123 +55,223 @@ if sys.platform == "win32":
 # 1. Logging Setup - Safe for Windows
 # -----------------------------
 def setup_logging():
-    """Setup logging with proper Unicode handling"""
-    # Create logs directory if it doesn't exist
-    os.makedirs('logs', exist_ok=True)
-    
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler('logs/email_worker.log', encoding='utf-8'),
-            logging.StreamHandler(sys.stdout)
-        ],
-        force=True
-    )
-    
-    logger = logging.getLogger(__name__)
+    """Queue-backed logging: rotating logs/email_worker.log and stdout, written by a listener thread"""
+    worker_logging.setup_logging()
     
     # Test logging
     logger.info("=== EMAIL PRIORITY CLASSIFIER STARTED ===")
-    return logger
 
-logger = setup_logging()
+# Handlers are only configured when the worker runs; importing stays silent
+logger = logging.getLogger(__name__)
 
 # -----------------------------
 # 2. Database Setup
 # -----------------------------
-try:
-    mongo_client = pymongo.MongoClient("mongodb://localhost:27017/peppermint")
-    db = mongo_client["peppermint"]
+# Set by init_connections(); importing this module never connects
+mongo_client = None
+db = None
+tickets_col = None
+emails_col = None
+email_queue_col = None
+worker_state_col = None
+redis_client = None
+
+def init_connections():
+    """Connect to MongoDB (raises when unreachable) and, optionally, Redis"""
+    global mongo_client, db, tickets_col, emails_col, email_queue_col, worker_state_col, redis_client
+    
+    mongo_client, db = connect_mongo()
     tickets_col = db["tickets"]
     emails_col = db["emailmessages"]
     email_queue_col = db["emailqueues"]
+    worker_state_col = db["workerstates"]
     logger.info("Connected to MongoDB")
-except Exception as e:
-    logger.error(f"Failed to connect to MongoDB: {e}")
-    sys.exit(1)
+    
+    redis_client = connect_redis()
+    if redis_client:
+        logger.info("Connected to Redis")
+    classification_cache.redis_client = redis_client
 
-redis_client = None
-try:
-    redis_client = redis.Redis(host="localhost", port=6379, db=0, decode_responses=True)
-    redis_client.ping()
-    logger.info("Connected to Redis")
-except Exception as e:
-    logger.warning(f"Failed to connect to Redis: {e} (continuing without caching)")
-    redis_client = None
+# -----------------------------
+# 3. Classification Pool
+# -----------------------------
+# Processes for CPU-bound classification; 0 classifies in the main thread
+POOL_SIZE = int(os.environ.get("EMAIL_WORKER_POOL_SIZE", "0"))
+# Smallest number of texts worth shipping to a separate process
+POOL_MIN_CHUNK = 8
+
+classifier_pool = None
+# Set in each pool process by init_pool_process
+pool_ready_barrier = None
+POOL_READY_TIMEOUT = 120
+
+def start_classifier_pool():
+    """Start the pool and wait until every process has warmed up TextBlob"""
+    global classifier_pool
+    if POOL_SIZE <= 0 or classifier_pool is not None:
+        return
+    
+    start_time = time.time()
+    barrier = multiprocessing.Barrier(POOL_SIZE)
+    classifier_pool = ProcessPoolExecutor(max_workers=POOL_SIZE, initializer=init_pool_process,
+                                          initargs=(worker_logging.pool_log_queue(), barrier))
+    # Each ready task holds its process at the barrier until all POOL_SIZE
+    # tasks are running, so every task lands on a distinct, warmed-up process
+    futures = [classifier_pool.submit(pool_ready) for _ in range(POOL_SIZE)]
+    pids = {future.result() for future in futures}
+    logger.info(f"Classification pool ready: {len(pids)} processes in {time.time() - start_time:.2f}s")
+
+def init_pool_process(log_queue, barrier):
+    """Pool initializer: log through the worker's listener, then warm up the classifier"""
+    global pool_ready_barrier
+    if log_queue is not None:
+        worker_logging.log_to_queue(log_queue)
+    pool_ready_barrier = barrier
+    classifier.warm_up()
+
+def pool_ready() -> int:
+    """Startup task: wait for the other pool processes to finish warming up"""
+    pool_ready_barrier.wait(POOL_READY_TIMEOUT)
+    return os.getpid()
+
+def stop_classifier_pool():
+    """Shut the pool down, if running"""
+    global classifier_pool
+    if classifier_pool is not None:
+        classifier_pool.shutdown(cancel_futures=True)
+        classifier_pool = None
+
+def observe_sentiment(results) -> Tuple[List[Optional[str]], List[str]]:
+    """Record sentiment lane timings of scored chunks and join their priorities and outcomes"""
+    priorities = []
+    outcomes = []
+    for chunk_priorities, chunk_outcomes, sentiment_seconds in results:
+        metrics.STAGE_SECONDS.observe(sentiment_seconds, stage="sentiment")
+        priorities.extend(chunk_priorities)
+        outcomes.extend(chunk_outcomes)
+    return priorities, outcomes
+
+def score_sentiment(texts: List[str], defer: bool = True) -> Tuple[List[Optional[str]], List[str]]:
+    """Run the sentiment lane in the pool when enabled, keeping the order of texts"""
+    budget = classifier.SENTIMENT_BUDGET_MS / 1000
+    if classifier_pool is None or len(texts) < POOL_MIN_CHUNK:
+        return observe_sentiment([classifier.score_texts_timed(texts, budget, defer)])
+    
+    chunk_count = min(POOL_SIZE, -(-len(texts) // POOL_MIN_CHUNK))
+    chunk_size = -(-len(texts) // chunk_count)
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    try:
+        return observe_sentiment(classifier_pool.map(
+            classifier.score_texts_timed, chunks, [budget] * len(chunks), [defer] * len(chunks)
+        ))
+    except BrokenProcessPool as e:
+        logger.error(f"Classification pool broke: {e} - classifying in the main thread and restarting the pool")
+        stop_classifier_pool()
+        result = observe_sentiment([classifier.score_texts_timed(texts, budget, defer)])
+        start_classifier_pool()
+        return result
 
 # -----------------------------
-# 3. Priority Detection
+# 4. Priority Detection
 # -----------------------------
-def detect_priority(subject: str, body: str = "") -> str:
+# Redis tier is attached by init_connections()
+classification_cache = ClassificationCache()
+
+def triage_priorities(docs: List[Tuple[str, str]]):
     """
-    Detect priority using keywords and sentiment analysis
-    Returns: 'critical', 'high', 'medium', or 'low'
+    Fast lane for a batch of (subject, body) pairs: cached results, then the
+    keyword pass. Returns the priority per document (None where sentiment
+    is still needed), the content key per non-empty document and the texts
+    left for the sentiment lane by content key.
     """
-    text = f"{subject} {body}".lower().strip()
+    classification_cache.set_version(classifier.classifier_version())
     
-    if not text:
-        return 'low'
+    texts = {}
+    for i, (subject, body) in enumerate(docs):
+        text = f"{subject} {body}".lower().strip()
+        if text:
+            texts[i] = text
     
-    # Critical keywords (highest priority)
-    critical_keywords = [
-        'urgent', 'critical', 'emergency', 'down', 'failure', 'broken', 
-        'crash', 'outage', 'immediate', 'catastrophic', 'production down',
-        'system down', 'server down', 'database down', 'major outage'
-    ]
-    if any(keyword in text for keyword in critical_keywords):
-        logger.debug(f"CRITICAL priority detected by keywords: {subject[:50]}...")
-        return 'critical'
-    
-    # High priority keywords
-    high_keywords = [
-        'severe', 'major', 'stop working', 'cannot access', 'security breach',
-        'data loss', 'performance issue', 'high priority', 'escalate'
-    ]
-    if any(keyword in text for keyword in high_keywords):
-        logger.debug("HIGH priority detected by keywords")
-        return 'high'
-    
-    # Medium priority technical keywords
-    medium_keywords = [
-        'error', 'bug', 'issue', 'problem', 'slow', 'not working', 
-        'login', 'password', 'access denied', 'timeout', 'warning'
-    ]
-    if any(keyword in text for keyword in medium_keywords):
-        logger.debug("MEDIUM priority detected by technical keywords")
-        return 'medium'
+    # Identical subject/body (alerts, duplicates) is classified once per config version
+    keys = {i: content_key(text) for i, text in texts.items()}
+    cached = classification_cache.get_many(keys.values())
     
-    # Sentiment analysis using TextBlob
-    try:
-        blob = TextBlob(text)
-        polarity = blob.sentiment.polarity
-        subjectivity = blob.sentiment.subjectivity
-        
-        logger.debug(f"Sentiment analysis - Polarity: {polarity:.3f}, Subjectivity: {subjectivity:.3f}")
-        
-        # Critical: extremely negative sentiment
-        if polarity < -0.4:
-            logger.debug("CRITICAL priority detected by sentiment analysis")
-            return 'critical'
-        
-        # High: very negative sentiment or high subjectivity (angry complaints)
-        elif polarity < -0.2 or (polarity < -0.1 and subjectivity > 0.8):
-            logger.debug("HIGH priority detected by sentiment analysis")
-            return 'high'
-        
-        # Medium: negative sentiment
-        elif polarity < -0.05:
-            logger.debug("MEDIUM priority detected by sentiment analysis")
-            return 'medium'
-        
-        # Low: neutral or positive
+    uncached = {}
+    for i, text in texts.items():
+        if keys[i] not in cached:
+            uncached.setdefault(keys[i], text)
+    
+    start_time = time.perf_counter()
+    tiers = dict(zip(uncached, classifier.match_keywords(list(uncached.values()))))
+    metrics.STAGE_SECONDS.observe(time.perf_counter() - start_time, stage="keyword")
+    classification_cache.put_many({key: tier for key, tier in tiers.items() if tier})
+    
+    priorities = ['low'] * len(docs)
+    pending = {}
+    outcomes = {"cached": 0, "keyword": 0, "empty": len(docs) - len(keys)}
+    for i, key in keys.items():
+        if key in cached:
+            priorities[i] = cached[key]
+            outcomes["cached"] += 1
+        elif tiers[key]:
+            priorities[i] = tiers[key]
+            outcomes["keyword"] += 1
         else:
-            logger.debug("LOW priority detected by sentiment analysis")
-            return 'low'
-            
-    except Exception as e:
-        logger.warning(f"Sentiment analysis failed: {e}, defaulting to low")
-        return 'low'
+            priorities[i] = None
+            pending[key] = texts[i]
+    for outcome, count in outcomes.items():
+        if count:
+            metrics.LANE_DOCUMENTS.inc(count, lane="fast", outcome=outcome)
+    return priorities, keys, pending
+
+def score_pending(priorities: List[Optional[str]], keys: Dict[int, str], pending: Dict[str, str],
+                  defer: bool = True) -> List[int]:
+    """
+    Sentiment lane: fill in the priorities triage_priorities left open.
+    Returns the indexes of documents deferred past the lane's budget;
+    their priority stays None.
+    """
+    if not pending:
+        return []
+    
+    scored, outcomes = score_sentiment(list(pending.values()), defer)
+    results = dict(zip(pending, zip(scored, outcomes)))
+    # Only full scores are cached: failures are retried by the next batch, degraded texts rescored
+    classification_cache.put_many({key: priority for key, (priority, outcome) in results.items()
+                                   if outcome == 'scored'})
+    
+    deferred = []
+    counts = {}
+    for i, key in keys.items():
+        if priorities[i] is not None:
+            continue
+        priority, outcome = results[key]
+        counts[outcome] = counts.get(outcome, 0) + 1
+        if outcome == 'deferred':
+            deferred.append(i)
+        else:
+            priorities[i] = priority or 'low'
+    for outcome, count in counts.items():
+        metrics.LANE_DOCUMENTS.inc(count, lane="sentiment", outcome=outcome)
+    return deferred
+
+def detect_priority_batch(docs: List[Tuple[str, str]]) -> List[str]:
+    """
+    Detect priority for a batch of (subject, body) pairs: cached results first,
+    then keywords and sentiment analysis for the rest. Long texts may be
+    degraded to fit the sentiment budget but nothing is deferred.
+    Returns: 'critical', 'high', 'medium', or 'low' per document
+    """
+    priorities, keys, pending = triage_priorities(docs)
+    score_pending(priorities, keys, pending, defer=False)
+    return priorities
+
+def detect_priority(subject: str, body: str = "") -> str:
+    """
+    Detect priority using keywords and sentiment analysis
+    Returns: 'critical', 'high', 'medium', or 'low'
+    """
+    return detect_priority_batch([(subject, body)])[0]
 
 def get_context(doc: Dict[str, Any], doc_type: str = "email") -> Dict[str, Any]:
     """Extract context for logging"""
@@ -173,97 +293,254 @@ def get_context(doc: Dict[str, Any], doc_type: str = "email") -> Dict[str, Any]:
         }
 
 # -----------------------------
-# 4. Update Email Priority
+# 5. Batched Result Sink
 # -----------------------------
-def update_email_priority(email_doc: Dict[str, Any]) -> bool:
-    """Update priority for a single email and its linked ticket"""
-    try:
+# Documents fetched per collection per cycle
+BATCH_SIZE = int(os.environ.get("EMAIL_WORKER_BATCH_SIZE", "10"))
+PRIORITY_CACHE_TTL = 3600
+
+def priority_update(new_priority: str) -> Dict[str, Any]:
+    """Update written for every classified email or ticket; also ends any lease"""
+    return {
+        "$set": {
+            "priority": new_priority,
+            "priority_updated_at": datetime.utcnow(),
+            "sentiment_analyzed": True
+        },
+        "$unset": CLAIM_FIELDS
+    }
+
+# Keep in sync with titleMatchKey() in models/Ticket.js
+TITLE_KEY_LENGTH = 50
+REPLY_PREFIX_RE = re.compile(r"^(?:(?:re|ref|fwd?)\s*:\s*)+")
+
+def title_match_key(title: str) -> str:
+    """Normalized ticket title used for indexed email-to-ticket matching"""
+    key = " ".join((title or "").split()).lower()
+    return REPLY_PREFIX_RE.sub("", key)[:TITLE_KEY_LENGTH]
+
+class ResultSink:
+    """
+    Collects classification results for a batch and writes them as one
+    unordered bulk_write per collection plus one Redis pipeline.
+    Every queued write is owned by the document that produced it so
+    failures are still accounted per document.
+    """
+
+    def __init__(self):
+        # (owner_id, is_primary, operation)
+        self.email_ops = []
+        self.ticket_ops = []
+        # (owner_id, sender, title match key, new priority) of fallback ticket matches
+        self.fallback_matches = []
+        self.cache_entries = []
+        # (owner_id, collection name, old priority, new priority) of primary updates
+        self.transitions = []
+
+    def add_email(self, email_doc: Dict[str, Any], new_priority: str):
+        """Queue the email update and the fallback ticket match"""
         email_id = email_doc['_id']
         subject = email_doc.get("subject", "")
-        body = email_doc.get("body", "")
         from_email = email_doc.get("from", "")
+        update = priority_update(new_priority)
         
-        # Skip if already analyzed
-        if email_doc.get('sentiment_analyzed', False):
-            logger.debug(f"Skipping already analyzed email: {subject[:50]}...")
-            return True
+        self.email_ops.append((email_id, True, UpdateOne({"_id": email_id}, update)))
+        
+        # A linked ticket is written by its own add_ticket when it was claimed with
+        # this email; one that is already analyzed (or leased elsewhere) is left alone
+        
+        # Fallback: Update tickets by email address and title match key (for existing data);
+        # resolved to ticket ids at flush time (see queue_fallback_tickets)
+        match_key = title_match_key(subject)
+        if from_email and match_key:
+            self.fallback_matches.append((email_id, from_email.lower(), match_key, new_priority))
+        
+        self.cache_entries.append((email_id, f"priority_email:{str(email_id)}", new_priority))
+        self.transitions.append((email_id, emails_col.name, email_doc.get("priority", "pending"), new_priority))
+
+    def add_ticket(self, ticket_doc: Dict[str, Any], new_priority: str):
+        """Queue the ticket update"""
+        ticket_id = ticket_doc['_id']
+        update = priority_update(new_priority)
+        
+        self.ticket_ops.append((ticket_id, True, UpdateOne({"_id": ticket_id}, update)))
+        
+        self.cache_entries.append((ticket_id, f"priority_ticket:{str(ticket_id)}", new_priority))
+        self.transitions.append((ticket_id, tickets_col.name, ticket_doc.get("priority", "pending"), new_priority))
+
+    def queue_fallback_tickets(self) -> List[Tuple[Any, str, Dict[str, Any]]]:
+        """
+        Look up the pending tickets the fallback matches hit in one query and
+        queue an update for each, so the counters know which tickets moved.
+        Tickets leased by a worker are left to it. Returns (owner_id, new
+        priority, ticket) per queued update.
+        """
+        if not self.fallback_matches:
+            return []
+        unleased = {"$or": [{"claim_expires_at": None}, {"claim_expires_at": {"$lt": datetime.utcnow()}}]}
+        owners = {}
+        for owner_id, sender, match_key, new_priority in self.fallback_matches:
+            owners.setdefault((sender, match_key), (owner_id, new_priority))
+        
+        tickets = tickets_col.find({"$and": [
+            {"$or": [{"email": sender, "titleMatchKey": match_key, "priority": "pending"}
+                     for sender, match_key in owners]},
+            unleased
+        ]}, {"email": 1, "titleMatchKey": 1, "createdAt": 1, "claim_count": 1})
         
-        # Detect new priority
-        new_priority = detect_priority(subject, body)
-        context = get_context(email_doc, "email")
+        matched = []
+        for ticket in tickets:
+            owner_id, new_priority = owners[(ticket.get("email"), ticket.get("titleMatchKey"))]
+            self.ticket_ops.append((owner_id, False, UpdateOne(
+                {"_id": ticket["_id"], "priority": "pending", **unleased}, priority_update(new_priority)
+            )))
+            matched.append((owner_id, new_priority, ticket))
+        return matched
+
+    def _write(self, collection, ops):
+        """
+        Run one unordered bulk_write; returns (failed owner ids, modified count,
+        documents modified by the non-primary operations)
+        """
+        failed = set()
+        if not ops:
+            return failed, 0, 0
+        
+        try:
+            result = collection.bulk_write([op for _, _, op in ops], ordered=False)
+            matched = result.matched_count
+            modified = result.modified_count
+        except BulkWriteError as bwe:
+            details = bwe.details
+            for err in details.get("writeErrors", []):
+                owner_id = ops[err["index"]][0]
+                logger.error(f"Failed to update {collection.name} for {owner_id}: {err.get('errmsg')}")
+                failed.add(owner_id)
+            matched = details.get("nMatched", 0)
+            modified = details.get("nModified", 0)
+        except Exception as e:
+            logger.error(f"Bulk write to {collection.name} failed: {e}")
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            return {owner_id for owner_id, _, _ in ops}, 0, 0
         
-        logger.info(f"Analyzing EMAIL {context['id'][:8]}: {context['subject']}...")
-        logger.info(f"Priority: {context['priority_before']} -> {new_priority} | From: {context['from']}")
+        # matched_count is only per batch; look up primaries when it cannot prove they all exist
+        primary_ids = [owner_id for owner_id, primary, _ in ops if primary and owner_id not in failed]
+        has_links = any(not primary for _, primary, _ in ops)
+        if primary_ids and (has_links or matched < len(primary_ids)):
+            found = {doc["_id"] for doc in collection.find({"_id": {"$in": primary_ids}}, {"_id": 1})}
+            for missing_id in primary_ids:
+                if missing_id not in found:
+                    logger.warning(f"Document not found for update in {collection.name}: {missing_id}")
+                    failed.add(missing_id)
         
-        # Cache result in Redis (optional)
-        if redis_client:
+        # Every primary that was found and written is modified (priority_updated_at always changes)
+        written = sum(1 for owner_id in primary_ids if owner_id not in failed)
+        return failed, modified, max(modified - written, 0)
+
+    def flush(self) -> set:
+        """Write everything queued so far; returns the ids of documents that failed"""
+        start_time = time.perf_counter()
+        email_failed, emails_modified, _ = self._write(emails_col, self.email_ops)
+        fallback = self.queue_fallback_tickets()
+        ticket_failed, tickets_modified, fallback_written = self._write(tickets_col, self.ticket_ops)
+        if fallback_written != len(fallback):
+            # A match was claimed or analyzed between lookup and write; the next reconcile settles it
+            fallback = []
+        failed = email_failed | ticket_failed
+        if self.email_ops or self.ticket_ops:
+            metrics.STAGE_SECONDS.observe(time.perf_counter() - start_time, stage="mongo_write")
+        
+        # Cache result and adjust priority counters in Redis (optional)
+        if redis_client and self.cache_entries:
+            start_time = time.perf_counter()
             try:
-                cache_key = f"priority_email:{str(email_id)}"
-                redis_client.setex(cache_key, 3600, new_priority)
+                pipe = redis_client.pipeline(transaction=False)
+                for owner_id, cache_key, new_priority in self.cache_entries:
+                    if owner_id not in failed:
+                        pipe.setex(cache_key, PRIORITY_CACHE_TTL, new_priority)
+                add_count_transitions(pipe, [
+                    (collection_name, old_priority, new_priority)
+                    for owner_id, collection_name, old_priority, new_priority in self.transitions
+                    if owner_id not in failed and old_priority != new_priority
+                ] + [
+                    (tickets_col.name, "pending", new_priority)
+                    for owner_id, new_priority, _ in fallback if owner_id not in failed
+                ])
+                pipe.execute()
+                metrics.STAGE_SECONDS.observe(time.perf_counter() - start_time, stage="redis_write")
             except Exception as cache_err:
                 logger.debug(f"Redis caching skipped: {cache_err}")
+            # Tickets the fallback analyzed before any worker claimed them
+            count_inserts(tickets_col.name, [ticket for owner_id, _, ticket in fallback if owner_id not in failed],
+                          claimed=False)
         
-        # Update EmailMessage
-        email_update_result = emails_col.update_one(
-            {"_id": email_id},
-            {"$set": {
-                "priority": new_priority,
-                "priority_updated_at": datetime.utcnow(),
-                "sentiment_analyzed": True
-            }}
-        )
+        if self.cache_entries:
+            logger.debug(f"Bulk write: {emails_modified} emails, {tickets_modified} tickets modified | "
+                        f"{len(failed)} documents failed")
         
-        if email_update_result.matched_count == 0:
-            logger.warning(f"Email not found for update: {email_id}")
-            return False
-        
-        updated_ticket_count = 0
-        
-        # Update linked ticket if emailId exists in ticket
-        if email_doc.get('ticketId'):
-            ticket_update_result = tickets_col.update_one(
-                {"_id": email_doc['ticketId']},
-                {"$set": {
-                    "priority": new_priority,
-                    "priority_updated_at": datetime.utcnow(),
-                    "sentiment_analyzed": True
-                }}
-            )
-            if ticket_update_result.modified_count > 0:
-                updated_ticket_count += 1
-                logger.info(f"Updated linked ticket via ticketId: {new_priority}")
-        
-        # Fallback: Update tickets by email address (for existing data)
-        if from_email:
-            ticket_fallback_result = tickets_col.update_many(
-                {
-                    "email": from_email.lower(),
-                    "title": { "$regex": subject[:50], "$options": "i" },
-                    "priority": "pending"
-                },
-                {"$set": {
-                    "priority": new_priority,
-                    "priority_updated_at": datetime.utcnow(),
-                    "sentiment_analyzed": True
-                }}
-            )
-            if ticket_fallback_result.modified_count > 0:
-                updated_ticket_count += ticket_fallback_result.modified_count
-                logger.info(f"Updated {ticket_fallback_result.modified_count} tickets via email match")
+        self.email_ops = []
+        self.ticket_ops = []
+        self.fallback_matches = []
+        self.cache_entries = []
+        self.transitions = []
+        return failed
+
+# -----------------------------
+# 6. Update Email / Ticket Priority
+# -----------------------------
+def update_email_priority(email_doc: Dict[str, Any], sink: Optional[ResultSink] = None,
+                          new_priority: Optional[str] = None) -> bool:
+    """
+    Classify a single email (unless the batch passed new_priority) and queue
+    its update. Linked tickets are only written when claimed alongside
+    (see classify_documents). Without a sink the writes are flushed immediately.
+    """
+    own_sink = sink is None
+    if own_sink:
+        sink = ResultSink()
+    
+    try:
+        email_id = email_doc['_id']
+        subject = email_doc.get("subject", "")
+        body = email_doc.get("body", "")
         
-        logger.info(f"Email updated: {new_priority} | Tickets updated: {updated_ticket_count}")
-        return True
+        # Skip if already analyzed
+        if email_doc.get('sentiment_analyzed', False):
+            logger.debug(f"Skipping already analyzed email: {subject[:50]}...")
+            return True
+        
+        # Detect new priority unless the batch already classified it
+        if new_priority is None:
+            new_priority = detect_priority(subject, normalize_body(body))
+        # Per-document lines are sampled; the batch summary carries the totals
+        if sample_document():
+            context = get_context(email_doc, "email")
+            logger.info(f"EMAIL {context['id'][:8]}: {context['subject']} | "
+                        f"{context['priority_before']} -> {new_priority} | From: {context['from']}",
+                        extra={"doc_id": context['id'], "collection": "emailmessages", "priority": new_priority})
+        
+        sink.add_email(email_doc, new_priority)
         
     except Exception as e:
         logger.error(f"Failed to update email {email_doc.get('_id')}: {e}")
         logger.error(f"Traceback: {traceback.format_exc()}")
         return False
+    
+    if own_sink:
+        return email_id not in sink.flush()
+    return True
 
-# -----------------------------
-# 5. Update Ticket Priority
-# -----------------------------
-def update_ticket_priority(ticket_doc: Dict[str, Any]) -> bool:
-    """Update priority for a single ticket"""
+def update_ticket_priority(ticket_doc: Dict[str, Any], sink: Optional[ResultSink] = None,
+                           new_priority: Optional[str] = None) -> bool:
+    """
+    Classify a single ticket (unless the batch passed new_priority) and queue
+    its update. Linked emails are only written when claimed alongside
+    (see classify_documents). Without a sink the writes are flushed immediately.
+    """
+    own_sink = sink is None
+    if own_sink:
+        sink = ResultSink()
+    
     try:
         ticket_id = ticket_doc['_id']
         subject = ticket_doc.get("title", "")
@@ -274,179 +551,1018 @@ def update_ticket_priority(ticket_doc: Dict[str, Any]) -> bool:
             logger.debug(f"Skipping already analyzed ticket: {ticket_doc.get('number', 'Unknown')}")
             return True
         
-        # Detect new priority
-        new_priority = detect_priority(subject, body)
-        context = get_context(ticket_doc, "ticket")
+        # Detect new priority unless the batch already classified it
+        if new_priority is None:
+            new_priority = detect_priority(subject, normalize_body(body))
+        if sample_document():
+            context = get_context(ticket_doc, "ticket")
+            logger.info(f"TICKET {context['number']}: {context['title']} | "
+                        f"{context['priority_before']} -> {new_priority}",
+                        extra={"doc_id": context['id'], "collection": "tickets", "priority": new_priority})
         
-        logger.info(f"Analyzing TICKET {context['number']}: {context['title']}...")
-        logger.info(f"Ticket priority: {context['priority_before']} -> {new_priority}")
+        sink.add_ticket(ticket_doc, new_priority)
         
-        # Cache result in Redis (optional)
-        if redis_client:
-            try:
-                cache_key = f"priority_ticket:{str(ticket_id)}"
-                redis_client.setex(cache_key, 3600, new_priority)
-            except Exception as cache_err:
-                logger.debug(f"Redis caching skipped: {cache_err}")
+    except Exception as e:
+        logger.error(f"Failed to update ticket {ticket_doc.get('_id')}: {e}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        return False
+    
+    if own_sink:
+        return ticket_id not in sink.flush()
+    return True
+
+# -----------------------------
+# 7. Work Claiming
+# -----------------------------
+# Leases let several workers share the queue; an expired lease is reclaimable
+WORKER_ID = os.environ.get("EMAIL_WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}"
+LEASE_SECONDS = int(os.environ.get("EMAIL_WORKER_LEASE_SECONDS", "120"))
+# Optional hash-of-_id sharding: worker SHARD_INDEX of SHARD_COUNT only claims its own documents.
+# Pending documents are stamped with shard_bucket (crc32 of the _id mod SHARD_BUCKETS) so the
+# shard filter runs on the server. Nothing takes over a dead worker's shard: its documents stay
+# pending until that worker is back or the shard config changes. SHARD_COUNT must not exceed
+# SHARD_BUCKETS.
+SHARD_COUNT = int(os.environ.get("EMAIL_WORKER_SHARD_COUNT", "1"))
+SHARD_INDEX = int(os.environ.get("EMAIL_WORKER_SHARD_INDEX", "0"))
+SHARD_BUCKETS = 64
+# Documents stamped with their bucket per claim
+SHARD_STAMP_CHUNK = 500
+
+CLAIM_FIELDS = {"claimed_by": "", "claim_token": "", "claim_expires_at": ""}
+
+# Leading characters of subjects/titles and bodies/details fetched for classification;
+# the body prefix covers everything normalize_body scans. 0 fetches the whole field.
+FETCH_SUBJECT_CHARS = int(os.environ.get("EMAIL_WORKER_FETCH_SUBJECT_CHARS", "500"))
+FETCH_BODY_CHARS = int(os.environ.get("EMAIL_WORKER_FETCH_BODY_CHARS", str(MAX_BODY_CHARS * HTML_SCAN_FACTOR)))
+
+class FetchedRecord:
+    """
+    Compact claimed document: just the fields classification and the update
+    functions read, in __slots__ instead of a full pymongo dict. Supports the
+    doc["_id"] / doc.get(field, default) access used throughout the worker.
+    """
+    # document field -> slot
+    FIELDS: Dict[str, str] = {}
+    # text field -> leading characters kept
+    PREFIXES: Dict[str, int] = {}
+    __slots__ = ()
+
+    def __init__(self, doc: Dict[str, Any]):
+        for field, slot in self.FIELDS.items():
+            value = doc.get(field)
+            limit = self.PREFIXES.get(field)
+            if limit and isinstance(value, str) and len(value) > limit:
+                value = value[:limit]
+            setattr(self, slot, value)
+
+    def get(self, field: str, default=None):
+        slot = self.FIELDS.get(field)
+        value = getattr(self, slot) if slot else None
+        return default if value is None else value
+
+    def __getitem__(self, field: str):
+        value = self.get(field)
+        if value is None:
+            raise KeyError(field)
+        return value
+
+    @classmethod
+    def projection(cls) -> Dict[str, int]:
+        return dict.fromkeys(cls.FIELDS, 1)
+
+    @classmethod
+    def project_stage(cls) -> Dict[str, Any]:
+        """$project that cuts the text fields down to their prefix on the server"""
+        return {"$project": {
+            field: {"$substrCP": [f"${field}", 0, cls.PREFIXES[field]]} if cls.PREFIXES.get(field) else 1
+            for field in cls.FIELDS
+        }}
+
+class EmailRecord(FetchedRecord):
+    FIELDS = {"_id": "id", "subject": "subject", "body": "body", "from": "sender", "priority": "priority",
+              "sentiment_analyzed": "sentiment_analyzed", "ticketId": "ticket_id", "createdAt": "created_at",
+              "claim_count": "claim_count"}
+    PREFIXES = {"subject": FETCH_SUBJECT_CHARS, "body": FETCH_BODY_CHARS}
+    __slots__ = tuple(FIELDS.values())
+
+class TicketRecord(FetchedRecord):
+    FIELDS = {"_id": "id", "title": "title", "detail": "detail", "email": "email", "priority": "priority",
+              "sentiment_analyzed": "sentiment_analyzed", "emailId": "email_id", "createdAt": "created_at",
+              "claim_count": "claim_count"}
+    PREFIXES = {"title": FETCH_SUBJECT_CHARS, "detail": FETCH_BODY_CHARS}
+    __slots__ = tuple(FIELDS.values())
+
+def fetch_records(collection, record, match: Dict[str, Any], batch_size: int = 0) -> List[FetchedRecord]:
+    """Claimed documents, oldest first, with their text fields truncated by the server"""
+    pipeline = [{"$match": match}, {"$sort": {"createdAt": 1}}, record.project_stage()]
+    cursor = collection.aggregate(pipeline, batchSize=batch_size) if batch_size else collection.aggregate(pipeline)
+    return [record(doc) for doc in cursor]
+
+def claimable_filter(now: datetime) -> Dict[str, Any]:
+    """Pending documents that nobody holds a live lease on"""
+    return {
+        "priority": "pending",
+        "sentiment_analyzed": {"$ne": True},
+        "$or": [
+            {"claim_expires_at": None},
+            {"claim_expires_at": {"$lt": now}}
+        ]
+    }
+
+def shard_bucket(doc_id) -> int:
+    return zlib.crc32(doc_id.binary) % SHARD_BUCKETS
+
+def in_shard(doc_id) -> bool:
+    """Whether this worker's shard owns the document"""
+    if SHARD_COUNT <= 1:
+        return True
+    return shard_bucket(doc_id) % SHARD_COUNT == SHARD_INDEX
+
+def shard_filter() -> Dict[str, Any]:
+    """This worker's shard as a query on shard_bucket; empty when not sharded"""
+    if SHARD_COUNT <= 1:
+        return {}
+    # Equality points let the shard index merge its createdAt runs instead of sorting in memory
+    return {"shard_bucket": {"$in": [bucket for bucket in range(SHARD_BUCKETS) if bucket % SHARD_COUNT == SHARD_INDEX]}}
+
+def stamp_shard_buckets(collection):
+    """Stamp the oldest pending documents that have no shard_bucket yet (any shard's)"""
+    if SHARD_COUNT <= 1:
+        return
+    # Unstamped documents sit under null in the shard index, so this never walks the stamped backlog
+    docs = list(collection.find(
+        {"priority": "pending", "shard_bucket": {"$exists": False}}, {"_id": 1}
+    ).sort("createdAt", 1).limit(SHARD_STAMP_CHUNK))
+    if docs:
+        collection.bulk_write([
+            UpdateOne({"_id": doc["_id"], "shard_bucket": {"$exists": False}},
+                      {"$set": {"shard_bucket": shard_bucket(doc["_id"])}})
+            for doc in docs
+        ], ordered=False)
+
+def lease_update(now: datetime, claim_token) -> Dict[str, Any]:
+    # claim_count stays after the write: a count of 1 marks a document's first claim (see count_inserts)
+    return {"$set": {
+        "claimed_by": WORKER_ID,
+        "claim_token": claim_token,
+        "claim_expires_at": now + timedelta(seconds=LEASE_SECONDS)
+    }, "$inc": {"claim_count": 1}}
+
+# Per-mailbox fair share of the email queue (deficit round robin); weights
+# come from EmailQueue.classificationWeight, 0 only gets spare capacity
+FAIR_SHARE = os.environ.get("EMAIL_WORKER_FAIR_SHARE", "1") != "0"
+MAILBOX_BACKLOG_REFRESH_SECONDS = 2.0
+MAILBOX_WEIGHT_REFRESH_SECONDS = 60.0
+# Mailboxes listed in the health output, largest backlog first
+MAILBOX_REPORT_TOP = 5
+
+class MailboxFairShare:
+    """
+    Splits each email claim across mailboxes with deficit round robin, so a
+    noisy mailbox cannot starve the others. Every round adds weight x 1
+    document to a mailbox's deficit and lets it take whole documents from
+    it; the round-robin position carries over between cycles. Capacity left
+    when the fair shares are used up goes to the oldest remaining emails.
+    The health check refreshes and reports from the main thread while the
+    pipeline's read thread picks, so both go through the lock.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.weights = {}
+        self.names = {}
+        self.weights_checked_at = float("-inf")
+        # mailbox id -> (claimable documents, oldest createdAt)
+        self.backlog = {}
+        self.backlog_checked_at = float("-inf")
+        self.deficits = {}
+        self.order = []
+        self.cursor = 0
+        self.reported = set()
+
+    def refresh(self, collection, claimable: Dict[str, Any], force: bool = False):
+        """Reload weights and the per-mailbox backlog when they are due"""
+        with self.lock:
+            self._refresh(collection, claimable, force)
+
+    def _refresh(self, collection, claimable: Dict[str, Any], force: bool):
+        now = time.monotonic()
+        if force or now - self.weights_checked_at >= MAILBOX_WEIGHT_REFRESH_SECONDS:
+            queues = list(db["emailqueues"].find({}, {"name": 1, "username": 1, "classificationWeight": 1}))
+            self.weights = {queue["_id"]: max(float(queue.get("classificationWeight", 1) or 0), 0.0)
+                            for queue in queues}
+            self.names = {queue["_id"]: queue.get("name") or queue.get("username") or str(queue["_id"])
+                          for queue in queues}
+            self.weights_checked_at = now
+        
+        if force or now - self.backlog_checked_at >= MAILBOX_BACKLOG_REFRESH_SECONDS:
+            groups = collection.aggregate([
+                {"$match": claimable},
+                {"$group": {"_id": "$mailbox", "backlog": {"$sum": 1}, "oldest": {"$min": "$createdAt"}}}
+            ])
+            self.backlog = {group["_id"]: (group["backlog"], group["oldest"]) for group in groups}
+            self.order = [mailbox for mailbox in self.order if mailbox in self.backlog]
+            self.order += [mailbox for mailbox in self.backlog if mailbox not in self.order]
+            self.deficits = {mailbox: deficit for mailbox, deficit in self.deficits.items() if mailbox in self.backlog}
+            self.cursor = self.cursor % len(self.order) if self.order else 0
+            self.backlog_checked_at = now
+
+    def weight(self, mailbox) -> float:
+        return self.weights.get(mailbox, 1.0)
+
+    def plan(self, limit: int) -> Dict[Any, int]:
+        """Documents each mailbox may take out of `limit` this cycle"""
+        remaining = {mailbox: self.backlog[mailbox][0] for mailbox in self.order}
+        quotas = {}
+        left = limit
+        while left > 0 and any(remaining[m] > 0 and self.weight(m) > 0 for m in self.order):
+            for step in range(len(self.order)):
+                index = (self.cursor + step) % len(self.order)
+                mailbox = self.order[index]
+                if remaining[mailbox] <= 0 or self.weight(mailbox) <= 0:
+                    continue
+                self.deficits[mailbox] = self.deficits.get(mailbox, 0.0) + self.weight(mailbox)
+                take = min(int(self.deficits[mailbox]), remaining[mailbox], left)
+                if take:
+                    quotas[mailbox] = quotas.get(mailbox, 0) + take
+                    remaining[mailbox] -= take
+                    self.deficits[mailbox] -= take
+                    left -= take
+                # An emptied mailbox keeps no credit, as in plain DRR
+                if remaining[mailbox] <= 0:
+                    self.deficits[mailbox] = 0.0
+                if left <= 0:
+                    self.cursor = index + 1
+                    break
+        return quotas
+
+    def pick(self, collection, claimable: Dict[str, Any], limit: int) -> List[ObjectId]:
+        """Candidate ids for one claim: fair shares first, then the oldest of the rest"""
+        with self.lock:
+            return self._pick(collection, claimable, limit)
+
+    def _pick(self, collection, claimable: Dict[str, Any], limit: int) -> List[ObjectId]:
+        self._refresh(collection, claimable, False)
+        picked = []
+        for mailbox, quota in self.plan(limit).items():
+            ids = [doc["_id"] for doc in collection.find(
+                {**claimable, "mailbox": mailbox}, {"_id": 1}
+            ).sort("createdAt", 1).limit(quota).batch_size(quota)]
+            if len(ids) < quota:
+                # Backlog snapshot was stale; the mailbox is (nearly) empty now
+                self.deficits[mailbox] = 0.0
+            picked += ids
         
-        # Update Ticket
-        ticket_update_result = tickets_col.update_one(
-            {"_id": ticket_id},
-            {"$set": {
-                "priority": new_priority,
-                "priority_updated_at": datetime.utcnow(),
-                "sentiment_analyzed": True
-            }}
+        if len(picked) < limit:
+            spare = limit - len(picked)
+            picked += [doc["_id"] for doc in collection.find(
+                {**claimable, "_id": {"$nin": picked}}, {"_id": 1}
+            ).sort("createdAt", 1).limit(spare).batch_size(spare)]
+        return picked
+
+    def report(self) -> Dict[str, Tuple[int, float]]:
+        """(backlog, lag seconds) per mailbox name, also exported as gauges"""
+        now = datetime.utcnow()
+        report = {}
+        with self.lock:
+            for mailbox, (backlog, oldest) in self.backlog.items():
+                name = self.names.get(mailbox, str(mailbox))
+                lag = max((now - oldest).total_seconds(), 0.0) if oldest else 0.0
+                report[name] = (backlog, lag)
+        # Mailboxes that caught up drop out of the snapshot; zero their gauges
+        for name in self.reported - set(report):
+            metrics.MAILBOX_BACKLOG.set(0, mailbox=name)
+            metrics.MAILBOX_LAG.set(0.0, mailbox=name)
+        for name, (backlog, lag) in report.items():
+            metrics.MAILBOX_BACKLOG.set(backlog, mailbox=name)
+            metrics.MAILBOX_LAG.set(lag, mailbox=name)
+        self.reported = set(report)
+        return report
+
+    def describe(self) -> str:
+        report = sorted(self.report().items(), key=lambda item: -item[1][0])
+        if not report:
+            return "Mailboxes: no backlog"
+        text = " ".join(f"{name}:{backlog}/{lag:.0f}s" for name, (backlog, lag) in report[:MAILBOX_REPORT_TOP])
+        if len(report) > MAILBOX_REPORT_TOP:
+            text += f" +{len(report) - MAILBOX_REPORT_TOP} more"
+        return f"Mailboxes {text}"
+
+fair_share = MailboxFairShare()
+
+def claim_pending(collection, record, limit: int) -> List[FetchedRecord]:
+    """
+    Lease up to `limit` claimable documents (the oldest, or for emails every
+    mailbox's fair share): pick candidate ids, claim the ones still claimable
+    in one update_many, then read back exactly the documents carrying this
+    claim's token
+    """
+    stamp_shard_buckets(collection)
+    now = datetime.utcnow()
+    # The shard filter runs on the server, so another shard's backlog never fills the window
+    claimable = {**claimable_filter(now), **shard_filter()}
+    
+    if FAIR_SHARE and collection is emails_col:
+        candidates = fair_share.pick(collection, claimable, limit)
+    else:
+        # One round-trip per cursor: batch_size covers the whole limit
+        candidates = [doc["_id"] for doc in collection.find(
+            claimable, {"_id": 1}
+        ).sort("createdAt", 1).limit(limit).batch_size(limit)]
+    if not candidates:
+        return []
+    
+    claim_token = ObjectId()
+    collection.update_many({**claimable, "_id": {"$in": candidates}}, lease_update(now, claim_token))
+    claimed = fetch_records(collection, record, {"_id": {"$in": candidates}, "claim_token": claim_token},
+                            len(candidates))
+    
+    if len(claimed) < len(candidates):
+        logger.debug(f"{len(candidates) - len(claimed)} {collection.name} taken by other workers")
+    count_inserts(collection.name, claimed)
+    return claimed
+
+def claim_linked(collection, record, link_filter: Dict[str, Any]) -> List[FetchedRecord]:
+    """
+    Lease the claimable documents linked to a claimed batch (tickets of its
+    emails or emails of its tickets). Shards are ignored: a pair is always
+    handled by the worker that claimed either side first.
+    """
+    now = datetime.utcnow()
+    claim_token = ObjectId()
+    result = collection.update_many({"$and": [claimable_filter(now), link_filter]}, lease_update(now, claim_token))
+    if not result.modified_count:
+        return []
+    claimed = fetch_records(collection, record, {"claim_token": claim_token})
+    count_inserts(collection.name, claimed)
+    return claimed
+
+def claim_one(collection, doc_id, record) -> Optional[FetchedRecord]:
+    """Lease a single document, or return None when it is not claimable"""
+    if not in_shard(doc_id):
+        return None
+    now = datetime.utcnow()
+    # findAndModify cannot cut fields down, the record truncates them here instead
+    doc = collection.find_one_and_update(
+        {**claimable_filter(now), "_id": doc_id},
+        lease_update(now, ObjectId()),
+        projection=record.projection(),
+        return_document=ReturnDocument.AFTER
+    )
+    if not doc:
+        return None
+    count_inserts(collection.name, [doc])
+    return record(doc)
+
+def release_claims(collection, doc_ids):
+    """Drop the leases of documents that failed or were deferred so the next cycle retries them"""
+    if not doc_ids:
+        return
+    try:
+        collection.update_many(
+            {"_id": {"$in": list(doc_ids)}, "claimed_by": WORKER_ID},
+            {"$unset": CLAIM_FIELDS}
         )
+    except Exception as e:
+        logger.warning(f"Could not release {len(doc_ids)} {collection.name} leases: {e} (they expire in {LEASE_SECONDS}s)")
+
+# Tickets per backfill run, and the last _id done so each run walks forward
+BACKFILL_CHUNK = 500
+backfill_last_id = None
+
+def backfill_title_match_keys():
+    """
+    Compute titleMatchKey for the next chunk of tickets written before the
+    field existed, walking the _id index; cancels itself once done
+    """
+    global backfill_last_id
+    try:
+        query = {"titleMatchKey": {"$exists": False}}
+        if backfill_last_id is not None:
+            query["_id"] = {"$gt": backfill_last_id}
+        tickets = list(tickets_col.find(query, {"title": 1}).sort("_id", 1).limit(BACKFILL_CHUNK))
         
-        if ticket_update_result.matched_count == 0:
-            logger.warning(f"Ticket not found for update: {ticket_id}")
-            return False
-        
-        # Update linked email if exists
-        updated_email_count = 0
-        if ticket_doc.get('emailId'):
-            email_update_result = emails_col.update_one(
-                {"_id": ticket_doc['emailId']},
-                {"$set": {
-                    "priority": new_priority,
-                    "priority_updated_at": datetime.utcnow(),
-                    "sentiment_analyzed": True
-                }}
-            )
-            if email_update_result.modified_count > 0:
-                updated_email_count += 1
-                logger.info(f"Updated linked email via emailId: {new_priority}")
+        if not tickets:
+            logger.info("✅ Ticket title match key backfill complete")
+            return schedule.CancelJob
         
-        logger.info(f"Ticket updated: {new_priority} | Linked email updated: {updated_email_count}")
-        return True
+        tickets_col.bulk_write([
+            UpdateOne(
+                {"_id": ticket["_id"], "titleMatchKey": {"$exists": False}},
+                {"$set": {"titleMatchKey": title_match_key(ticket.get("title", ""))}}
+            )
+            for ticket in tickets
+        ], ordered=False)
+        backfill_last_id = tickets[-1]["_id"]
+        logger.info(f"Backfilled title match keys for {len(tickets)} tickets")
         
     except Exception as e:
-        logger.error(f"Failed to update ticket {ticket_doc.get('_id')}: {e}")
-        logger.error(f"Traceback: {traceback.format_exc()}")
-        return False
+        logger.error(f"Title match key backfill failed: {e} (retrying next run)")
 
 # -----------------------------
-# 6. Process Pending Items
+# 8. Process Pending Items
 # -----------------------------
-def process_pending_emails():
-    """Process all pending emails"""
+def record_batch(collection_name: str, success_count: int, failed_count: int, elapsed: float):
+    """Per-collection results and throughput of one batch"""
+    metrics.DOCUMENTS.inc(success_count, collection=collection_name, result="success")
+    metrics.DOCUMENTS.inc(failed_count, collection=collection_name, result="failure")
+    if elapsed > 0:
+        metrics.THROUGHPUT.set((success_count + failed_count) / elapsed, collection=collection_name)
+
+def pair_text(email_doc: Dict[str, Any], ticket_doc: Dict[str, Any]) -> Tuple[str, str]:
+    """Combined (subject, body) of a linked email/ticket, without repeating shared text"""
+    subject = email_doc.get("subject", "")
+    title = ticket_doc.get("title", "")
+    if title and title_match_key(title) != title_match_key(subject):
+        subject = f"{subject} {title}"
+    
+    body = normalize_body(email_doc.get("body", ""))
+    # Tickets opened from an email usually repeat its body in the detail
+    detail = normalize_body(ticket_doc.get("detail", ""))
+    if detail and detail != body:
+        body = f"{body} {detail}"
+    return subject, body
+
+def pair_documents(emails: List[Dict[str, Any]], tickets: List[Dict[str, Any]]):
+    """Match emails to tickets on ticketId/emailId; returns (pairs, lone emails, lone tickets)"""
+    tickets_by_id = {ticket["_id"]: ticket for ticket in tickets}
+    tickets_by_email = {ticket["emailId"]: ticket for ticket in tickets if ticket.get("emailId")}
+    
+    pairs = []
+    lone_emails = []
+    paired_ticket_ids = set()
+    for email_doc in emails:
+        ticket_doc = tickets_by_id.get(email_doc.get("ticketId")) or tickets_by_email.get(email_doc["_id"])
+        if ticket_doc is not None and ticket_doc["_id"] not in paired_ticket_ids:
+            paired_ticket_ids.add(ticket_doc["_id"])
+            pairs.append((email_doc, ticket_doc))
+        else:
+            lone_emails.append(email_doc)
+    lone_tickets = [ticket for ticket in tickets if ticket["_id"] not in paired_ticket_ids]
+    return pairs, lone_emails, lone_tickets
+
+class ClassifiedBatch:
+    """Claimed documents of one lane of a batch with their priorities and queued writes"""
+
+    def __init__(self, email_docs, ticket_docs, email_priorities, ticket_priorities, pairs, start_time,
+                 lane="sentiment"):
+        self.email_docs = email_docs
+        self.ticket_docs = ticket_docs
+        self.email_priorities = email_priorities
+        self.ticket_priorities = ticket_priorities
+        self.pairs = pairs
+        self.start_time = start_time
+        self.lane = lane
+        self.sink = ResultSink()
+        self.failed_emails = set()
+        self.failed_tickets = set()
+        # Documents claimed for the whole batch, including ones another lane wrote or deferred
+        self.claimed = len(email_docs) + len(ticket_docs)
+        self.deferred = 0
+
+def queue_batch(docs: List[Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]],
+                priorities: List[str], start_time: float, lane: str) -> ClassifiedBatch:
+    """Queue the writes of (email, ticket) entries, either side optional, in one sink"""
+    batch = ClassifiedBatch(
+        email_docs=[email_doc for email_doc, _ in docs if email_doc],
+        ticket_docs=[ticket_doc for _, ticket_doc in docs if ticket_doc],
+        email_priorities=[priority for (email_doc, _), priority in zip(docs, priorities) if email_doc],
+        ticket_priorities=[priority for (_, ticket_doc), priority in zip(docs, priorities) if ticket_doc],
+        pairs=sum(1 for email_doc, ticket_doc in docs if email_doc and ticket_doc),
+        start_time=start_time,
+        lane=lane
+    )
+    
+    for email_doc, new_priority in zip(batch.email_docs, batch.email_priorities):
+        try:
+            if not update_email_priority(email_doc, batch.sink, new_priority):
+                batch.failed_emails.add(email_doc['_id'])
+        except Exception as doc_error:
+            logger.error(f"Error processing email {email_doc.get('_id')}: {doc_error}")
+            batch.failed_emails.add(email_doc['_id'])
+    
+    for ticket_doc, new_priority in zip(batch.ticket_docs, batch.ticket_priorities):
+        try:
+            if not update_ticket_priority(ticket_doc, batch.sink, new_priority):
+                batch.failed_tickets.add(ticket_doc['_id'])
+        except Exception as doc_error:
+            logger.error(f"Error processing ticket {ticket_doc.get('number', ticket_doc.get('_id'))}: {doc_error}")
+            batch.failed_tickets.add(ticket_doc['_id'])
+    
+    return batch
+
+def classify_batch(emails: List[Dict[str, Any]], tickets: List[Dict[str, Any]],
+                   start_time: float) -> Optional[ClassifiedBatch]:
+    """
+    Classify claimed emails and tickets in two lanes. Cached results and
+    keyword hits are final, so when anything still needs sentiment analysis
+    they are written right away; the sentiment lane's writes are returned
+    for write_batch. Documents the sentiment lane defers are released for a
+    later cycle. A linked email/ticket pair is classified once from its
+    combined text and both sides get the same priority.
+    """
+    if not emails and not tickets:
+        return None
+    
+    pairs, lone_emails, lone_tickets = pair_documents(emails, tickets)
+    docs = pairs + [(email_doc, None) for email_doc in lone_emails] + [(None, ticket_doc) for ticket_doc in lone_tickets]
+    
+    # Bodies are cut down to the newest message so quoted history neither costs time nor matches keywords
+    texts = [pair_text(email_doc, ticket_doc) for email_doc, ticket_doc in pairs]
+    texts += [(email_doc.get("subject", ""), normalize_body(email_doc.get("body", ""))) for email_doc in lone_emails]
+    texts += [(ticket_doc.get("title", ""), normalize_body(ticket_doc.get("detail", ""))) for ticket_doc in lone_tickets]
+    priorities, keys, pending = triage_priorities(texts)
+    
+    fast = [i for i, priority in enumerate(priorities) if priority]
+    slow = [i for i, priority in enumerate(priorities) if not priority]
+    if not slow:
+        batch = queue_batch(docs, priorities, start_time, lane="fast")
+        batch.claimed = len(emails) + len(tickets)
+        return batch
+    if fast:
+        write_batch(queue_batch([docs[i] for i in fast], [priorities[i] for i in fast], start_time, lane="fast"))
+    
+    deferred = set(score_pending(priorities, keys, pending))
+    if deferred:
+        release_claims(emails_col, [docs[i][0]['_id'] for i in deferred if docs[i][0]])
+        release_claims(tickets_col, [docs[i][1]['_id'] for i in deferred if docs[i][1]])
+    
+    scored = [i for i in slow if i not in deferred]
+    batch = queue_batch([docs[i] for i in scored], [priorities[i] for i in scored], start_time, lane="sentiment")
+    batch.claimed = len(emails) + len(tickets)
+    batch.deferred = sum((docs[i][0] is not None) + (docs[i][1] is not None) for i in deferred)
+    return batch
+
+def write_batch(batch: ClassifiedBatch) -> int:
+    """Flush a classified batch, release the leases of failures; returns the number of documents claimed"""
+    email_docs, ticket_docs = batch.email_docs, batch.ticket_docs
+    failed_emails, failed_tickets = batch.failed_emails, batch.failed_tickets
+    
+    flush_failed = batch.sink.flush()
+    failed_emails |= {doc['_id'] for doc in email_docs if doc['_id'] in flush_failed}
+    failed_tickets |= {doc['_id'] for doc in ticket_docs if doc['_id'] in flush_failed}
+    release_claims(emails_col, failed_emails)
+    release_claims(tickets_col, failed_tickets)
+    
+    elapsed = time.perf_counter() - batch.start_time
+    if email_docs:
+        record_batch(emails_col.name, len(email_docs) - len(failed_emails), len(failed_emails), elapsed)
+    if ticket_docs:
+        record_batch(tickets_col.name, len(ticket_docs) - len(failed_tickets), len(failed_tickets), elapsed)
+    
+    # One summary record per batch instead of per-document lines
+    distribution = {}
+    for new_priority in batch.email_priorities + batch.ticket_priorities:
+        distribution[new_priority] = distribution.get(new_priority, 0) + 1
+    deferred = f" | {batch.deferred} deferred" if batch.deferred else ""
+    logger.info(f"[BATCH] {batch.lane} | emails {len(email_docs) - len(failed_emails)} ok/{len(failed_emails)} failed | "
+                f"tickets {len(ticket_docs) - len(failed_tickets)} ok/{len(failed_tickets)} failed | "
+                f"{batch.pairs} pairs | {' '.join(f'{k}:{v}' for k, v in sorted(distribution.items()))}{deferred} | "
+                f"{elapsed * 1e3:.0f}ms",
+                extra={"lane": batch.lane, "emails": len(email_docs), "tickets": len(ticket_docs),
+                       "pairs": batch.pairs, "failed_emails": len(failed_emails),
+                       "failed_tickets": len(failed_tickets), "deferred": batch.deferred,
+                       "priorities": distribution, "elapsed_ms": round(elapsed * 1e3, 1)})
+    return batch.claimed
+
+def classify_documents(emails: List[Dict[str, Any]], tickets: List[Dict[str, Any]], start_time: float) -> int:
+    """Classify and write one batch in the calling thread; returns the number of documents"""
+    batch = classify_batch(emails, tickets, start_time)
+    return write_batch(batch) if batch else 0
+
+def claim_linked_tickets(pending_emails: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Lease the pending tickets linked to claimed emails"""
+    return claim_linked(tickets_col, TicketRecord, {"$or": [
+        {"_id": {"$in": [email_doc["ticketId"] for email_doc in pending_emails if email_doc.get("ticketId")]}},
+        {"emailId": {"$in": [email_doc["_id"] for email_doc in pending_emails]}}
+    ]})
+
+def claim_linked_emails(pending_tickets: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Lease the pending emails linked to claimed tickets"""
+    return claim_linked(emails_col, EmailRecord, {"$or": [
+        {"_id": {"$in": [ticket_doc["emailId"] for ticket_doc in pending_tickets if ticket_doc.get("emailId")]}},
+        {"ticketId": {"$in": [ticket_doc["_id"] for ticket_doc in pending_tickets]}}
+    ]})
+
+def process_claimed_emails(pending_emails: List[Dict[str, Any]], start_time: float) -> int:
+    """Classify claimed emails together with their linked tickets"""
+    return classify_documents(pending_emails, claim_linked_tickets(pending_emails), start_time)
+
+def process_claimed_tickets(pending_tickets: List[Dict[str, Any]], start_time: float) -> int:
+    """Classify claimed tickets together with their linked emails"""
+    return classify_documents(claim_linked_emails(pending_tickets), pending_tickets, start_time)
+
+def process_pending_emails(limit: int = BATCH_SIZE) -> int:
+    """Process up to `limit` pending emails (plus their linked tickets); returns how many were claimed"""
     try:
-        # Find pending emails (no folder filter)
-        pending_emails = list(emails_col.find(
-            {
-                "priority": "pending", 
-                "sentiment_analyzed": {"$ne": True}
-            },
-            projection={"subject": 1, "body": 1, "from": 1, "priority": 1, "sentiment_analyzed": 1, "ticketId": 1},
-            limit=10  # Process 10 at a time
-        ).sort("createdAt", 1))
+        # Lease pending emails (no folder filter)
+        start_time = time.perf_counter()
+        pending_emails = claim_pending(emails_col, EmailRecord, limit)
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - start_time, stage="fetch")
         
         if not pending_emails:
             logger.debug("No pending emails found")
-            return
-        
-        logger.info(f"[EMAILS] Processing {len(pending_emails)} pending emails...")
-        
-        success_count = 0
-        failed_count = 0
-        
-        for email_doc in pending_emails:
-            try:
-                if update_email_priority(email_doc):
-                    success_count += 1
-                else:
-                    failed_count += 1
-            except Exception as doc_error:
-                logger.error(f"Error processing email {email_doc.get('_id')}: {doc_error}")
-                failed_count += 1
+            return 0
         
-        logger.info(f"[EMAILS] Batch complete: {success_count} successful, {failed_count} failed")
+        return process_claimed_emails(pending_emails, start_time)
         
     except Exception as e:
         logger.error(f"Error in process_pending_emails: {e}")
         logger.error(f"Traceback: {traceback.format_exc()}")
+        return 0
 
-def process_pending_tickets():
-    """Process all pending tickets"""
+def process_pending_tickets(limit: int = BATCH_SIZE) -> int:
+    """Process up to `limit` pending tickets (plus their linked emails); returns how many were claimed"""
     try:
-        # Find pending tickets
-        pending_tickets = list(tickets_col.find(
-            {
-                "priority": "pending", 
-                "sentiment_analyzed": {"$ne": True}
-            },
-            projection={"title": 1, "detail": 1, "email": 1, "priority": 1, "sentiment_analyzed": 1, "emailId": 1},
-            limit=10  # Process 10 at a time
-        ).sort("createdAt", 1))
+        # Lease pending tickets
+        start_time = time.perf_counter()
+        pending_tickets = claim_pending(tickets_col, TicketRecord, limit)
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - start_time, stage="fetch")
         
         if not pending_tickets:
             logger.debug("No pending tickets found")
-            return
-        
-        logger.info(f"[TICKETS] Processing {len(pending_tickets)} pending tickets...")
-        
-        success_count = 0
-        failed_count = 0
+            return 0
         
-        for ticket_doc in pending_tickets:
-            try:
-                if update_ticket_priority(ticket_doc):
-                    success_count += 1
-                else:
-                    failed_count += 1
-            except Exception as doc_error:
-                logger.error(f"Error processing ticket {ticket_doc.get('number', ticket_doc.get('_id'))}: {doc_error}")
-                failed_count += 1
-        
-        logger.info(f"[TICKETS] Batch complete: {success_count} successful, {failed_count} failed")
+        return process_claimed_tickets(pending_tickets, start_time)
         
     except Exception as e:
         logger.error(f"Error in process_pending_tickets: {e}")
         logger.error(f"Traceback: {traceback.format_exc()}")
+        return 0
+
+# Documents per cycle, split between emails and tickets by their lag
+CYCLE_CAPACITY = int(os.environ.get("EMAIL_WORKER_CYCLE_CAPACITY", str(2 * BATCH_SIZE)))
+# Smallest share a queue with work gets, so the younger backlog still moves
+MIN_QUEUE_SHARE = 0.1
+# Idle back-off: first wait, doubled per empty cycle up to the maximum
+IDLE_DELAY_MIN = 0.25
+IDLE_DELAY_MAX = float(os.environ.get("EMAIL_WORKER_MAX_IDLE_SECONDS", "10"))
+# Queue lag is looked up at most this often while draining
+LAG_REFRESH_SECONDS = 2.0
+
+class BacklogScheduler:
+    """
+    Decides how much of each queue to take per cycle and how long to wait
+    between cycles: no wait while there is a backlog, exponential back-off
+    while idle
+    """
+
+    def __init__(self):
+        self.mode = "starting"
+        self.idle_delay = 0.0
+        self.lags = {}
+        self.lags_checked_at = 0.0
+        self.email_limit = CYCLE_CAPACITY - CYCLE_CAPACITY // 2
+        self.ticket_limit = CYCLE_CAPACITY // 2
+        # Whether either queue filled its share in the last cycle, i.e. there is a backlog
+        self.cycle_full = False
+        # Stage utilization of the last pipeline run
+        self.last_utilization = {}
+
+    def split_capacity(self):
+        """Give each queue a share of the cycle proportional to its lag"""
+        if time.monotonic() - self.lags_checked_at >= LAG_REFRESH_SECONDS:
+            self.lags = update_queue_lag()
+            self.lags_checked_at = time.monotonic()
+        
+        email_lag = self.lags.get(emails_col.name, 0.0)
+        ticket_lag = self.lags.get(tickets_col.name, 0.0)
+        floor = max(1, int(CYCLE_CAPACITY * MIN_QUEUE_SHARE))
+        if email_lag + ticket_lag <= 0:
+            self.email_limit = CYCLE_CAPACITY - CYCLE_CAPACITY // 2
+        else:
+            share = round(CYCLE_CAPACITY * email_lag / (email_lag + ticket_lag))
+            self.email_limit = min(max(share, floor), CYCLE_CAPACITY - floor)
+        self.ticket_limit = CYCLE_CAPACITY - self.email_limit
+
+    def record(self, processed: int) -> float:
+        """Update the mode after a cycle; returns seconds to wait before the next one"""
+        if processed:
+            self.mode = "draining"
+            self.idle_delay = 0.0
+        else:
+            self.mode = "idle"
+            self.idle_delay = min(IDLE_DELAY_MAX, max(IDLE_DELAY_MIN, self.idle_delay * 2))
+        return self.idle_delay
+
+    def describe(self) -> str:
+        if self.mode == "idle":
+            text = f"Scheduler: idle (next poll in {self.idle_delay:.2f}s)"
+        else:
+            text = f"Scheduler: {self.mode} (E:{self.email_limit}/T:{self.ticket_limit} per cycle)"
+        if self.last_utilization:
+            text += " | Pipeline " + " ".join(f"{name}:{busy:.0%}" for name, busy in self.last_utilization.items())
+        return text
 
-def process_all_pending():
-    """Process both emails and tickets"""
+scheduler = BacklogScheduler()
+# Inactive until the worker receives SIGUSR1
+profiler = CycleProfiler()
+
+def process_all_pending() -> int:
+    """One cycle over both queues; returns the number of documents claimed"""
     start_time = time.time()
     
-    process_pending_emails()
-    time.sleep(0.5)  # Brief pause between batches
-    process_pending_tickets()
+    profiler.before_cycle()
+    try:
+        scheduler.split_capacity()
+        emails = process_pending_emails(scheduler.email_limit)
+        tickets = process_pending_tickets(scheduler.ticket_limit)
+        scheduler.cycle_full = emails >= scheduler.email_limit or tickets >= scheduler.ticket_limit
+        processed = emails + tickets
+    finally:
+        profiler.after_cycle()
     
     elapsed = time.time() - start_time
-    logger.debug(f"Full processing cycle completed in {elapsed:.2f}s")
+    logger.debug(f"Full processing cycle completed in {elapsed:.2f}s ({processed} documents)")
+    return processed
+
+# Held while a drain runs; scheduled jobs run inside long drains, so the sweep may find it taken
+drain_lock = threading.Lock()
+
+def drain_backlog(max_seconds: float = 10.0, run_jobs: bool = False) -> int:
+    """
+    Run cycles back to back until both queues are empty or max_seconds pass.
+    Once a cycle comes back full the rest of the backlog goes through the
+    staged pipeline. run_jobs keeps health checks and other scheduled jobs
+    going during long drains. Not reentrant: a drain started while another
+    is running (the sweep job inside a run_jobs drain) returns 0 at once,
+    since the cache, scheduler and fair share are not thread-safe.
+    """
+    if not drain_lock.acquire(blocking=False):
+        logger.debug("Drain already running - skipping")
+        return 0
+    deadline = time.monotonic() + max_seconds
+    previous_mode = scheduler.mode
+    scheduler.mode = "draining"
+    total = 0
+    try:
+        while True:
+            processed = process_all_pending()
+            total += processed
+            if not processed or time.monotonic() >= deadline:
+                return total
+            if PIPELINE_DEPTH > 0 and scheduler.cycle_full:
+                return total + run_pipeline(deadline - time.monotonic(), run_jobs)
+            if run_jobs:
+                schedule.run_pending()
+    finally:
+        scheduler.mode = previous_mode
+        drain_lock.release()
+
+# Staged pipeline for large backlogs.
+# Batches buffered between stages (read -> classify -> write); 0 disables the pipeline
+PIPELINE_DEPTH = int(os.environ.get("EMAIL_WORKER_PIPELINE_DEPTH", "2"))
+
+def make_batch_reader():
+    """
+    Pipeline source: claims email and ticket batches in turn, sized by the lag
+    split, each with its linked partners; returns None once both queues are empty
+    """
+    turns = []
+    empty_turns = [0]
+    
+    def read_batch():
+        while empty_turns[0] < 2:
+            if not turns:
+                scheduler.split_capacity()
+                turns.extend([
+                    (emails_col, EmailRecord, scheduler.email_limit, claim_linked_tickets),
+                    (tickets_col, TicketRecord, scheduler.ticket_limit, claim_linked_emails)
+                ])
+            collection, record, limit, claim_partners = turns.pop(0)
+            
+            start_time = time.perf_counter()
+            claimed = claim_pending(collection, record, limit)
+            metrics.STAGE_SECONDS.observe(time.perf_counter() - start_time, stage="fetch")
+            if not claimed:
+                empty_turns[0] += 1
+                continue
+            empty_turns[0] = 0
+            
+            partners = claim_partners(claimed)
+            if collection is emails_col:
+                return claimed, partners, start_time
+            return partners, claimed, start_time
+        return None
+    
+    return read_batch
+
+def run_pipeline(max_seconds: float, run_jobs: bool = False) -> int:
+    """
+    Drain the backlog with fetching, classification and writing overlapped on
+    three threads; logs how busy each stage was. Returns the documents written.
+    """
+    written = []
+    stages = [
+        Stage("classify", lambda claimed: classify_batch(*claimed)),
+        Stage("write", lambda batch: written.append(write_batch(batch)))
+    ]
+    staged = Pipeline(make_batch_reader(), stages, queue_size=PIPELINE_DEPTH)
+    staged.start(max_seconds)
+    
+    try:
+        while not staged.join(timeout=0.5):
+            if run_jobs:
+                schedule.run_pending()
+    except KeyboardInterrupt:
+        # Let batches already claimed finish so their leases are not left behind
+        staged.stop()
+        staged.join()
+        raise
+    
+    utilization = staged.utilization()
+    for stage_name, busy in utilization.items():
+        metrics.STAGE_UTILIZATION.set(busy, stage=stage_name)
+    scheduler.last_utilization = utilization
+    
+    total = sum(written)
+    elapsed = staged.finished_at - staged.started_at
+    logger.info(f"[PIPELINE] {total} documents in {elapsed:.1f}s ({total / max(elapsed, 1e-9):.0f}/s) | "
+                f"busy {' '.join(f'{name}:{busy:.0%}' for name, busy in utilization.items())}",
+                extra={"documents": total, "elapsed_s": round(elapsed, 2),
+                       "utilization": {name: round(busy, 3) for name, busy in utilization.items()}})
+    return total
+
+# -----------------------------
+# 9. Priority Counters
+# -----------------------------
+# Redis hashes "priority_counts:<collection>" with one field per priority plus
+# "total" and "unanalyzed" (pending and not yet analyzed). Classification writes
+# adjust them incrementally and a document's first claim counts it as an insert;
+# a $facet aggregation periodically resets them. Inserts that are never pending
+# are only picked up by the next reset.
+# Resets race with writes and are not fixed up: a document inserted while the
+# aggregation runs (after "since" is taken) can be in the counts and counted
+# again on its first claim, and a classification write landing mid-reset can be
+# applied twice or lost. The drift is bounded by the writes during one
+# aggregation and cleared by the next reset.
+RECONCILE_SECONDS = int(os.environ.get("EMAIL_WORKER_RECONCILE_SECONDS", "300"))
+PRIORITY_ORDER = ["pending", "critical", "high", "medium", "low"]
+
+def counts_key(collection_name: str) -> str:
+    return f"priority_counts:{collection_name}"
+
+def counted_since_key(collection_name: str) -> str:
+    """When the counters were last reset; documents created earlier are already in them"""
+    return f"priority_counts_since:{collection_name}"
+
+def add_count_transitions(pipe, transitions):
+    """Queue counter updates for (collection name, old priority, new priority) moves"""
+    for collection_name, old_priority, new_priority in transitions:
+        key = counts_key(collection_name)
+        pipe.hincrby(key, old_priority, -1)
+        pipe.hincrby(key, new_priority, 1)
+        if old_priority == "pending":
+            pipe.hincrby(key, "unanalyzed", -1)
+
+def created_at(doc) -> datetime:
+    return doc.get("createdAt") or doc["_id"].generation_time.replace(tzinfo=None)
+
+def count_inserts(collection_name: str, docs, claimed: bool = True):
+    """
+    Account for documents inserted since the counters were reset: the ones
+    created after the reset and claimed for the first time (or, with
+    claimed=False, analyzed by a fallback match without ever being claimed).
+    Every claim path (polling, the watch sweep, change events, linked
+    partners) goes through here, so each document is counted once.
+    """
+    if not redis_client:
+        return
+    first_claims = [doc for doc in docs if (doc.get("claim_count") or 0) == int(claimed)]
+    if not first_claims:
+        return
+    try:
+        since = redis_client.get(counted_since_key(collection_name))
+        if not since:
+            # Never reset: the counters do not exist yet
+            return
+        since = datetime.fromisoformat(since)
+        inserted = sum(1 for doc in first_claims if created_at(doc) >= since)
+        if not inserted:
+            return
+        pipe = redis_client.pipeline(transaction=False)
+        for field in ("total", "pending", "unanalyzed"):
+            pipe.hincrby(counts_key(collection_name), field, inserted)
+        pipe.execute()
+    except Exception as e:
+        logger.debug(f"Redis counter update failed: {e}")
+
+def count_priorities(collection) -> Dict[str, int]:
+    """
+    Full priority distribution of a collection in one $facet aggregation;
+    the unanalyzed count runs on its own since $facet cannot use indexes
+    """
+    result = next(collection.aggregate([
+        {"$facet": {
+            "total": [{"$count": "n"}],
+            "priorities": [{"$group": {"_id": "$priority", "n": {"$sum": 1}}}]
+        }}
+    ]), {})
+    
+    counts = dict.fromkeys(PRIORITY_ORDER, 0)
+    counts.update({str(group["_id"]): group["n"] for group in result.get("priorities", [])})
+    counts["total"] = result["total"][0]["n"] if result.get("total") else 0
+    counts["unanalyzed"] = collection.count_documents({"priority": "pending", "sentiment_analyzed": {"$ne": True}})
+    return counts
+
+def reconcile_priority_counts():
+    """Reset the Redis counters from the collections"""
+    if not redis_client:
+        return
+    try:
+        for collection in (emails_col, tickets_col):
+            # Taken before counting: inserts during the aggregation may be counted twice
+            # (see the section header), but none are missed
+            since = datetime.utcnow()
+            counts = count_priorities(collection)
+            pipe = redis_client.pipeline(transaction=True)
+            pipe.delete(counts_key(collection.name))
+            pipe.hset(counts_key(collection.name), mapping=counts)
+            pipe.set(counted_since_key(collection.name), since.isoformat())
+            pipe.execute()
+        logger.debug("Priority counters reconciled")
+    except Exception as e:
+        logger.error(f"Priority counter reconcile failed: {e}")
+
+def read_priority_counts(collection) -> Dict[str, int]:
+    """Counters from Redis in O(1); falls back to the aggregation without Redis"""
+    if redis_client:
+        try:
+            counts = {field: int(value) for field, value in redis_client.hgetall(counts_key(collection.name)).items()}
+            # Drift (re-imported documents, lost updates) shows up as negatives
+            if counts and min(counts.values()) >= 0:
+                return counts
+            reconcile_priority_counts()
+            counts = {field: int(value) for field, value in redis_client.hgetall(counts_key(collection.name)).items()}
+            if counts:
+                return counts
+        except Exception as e:
+            logger.debug(f"Redis counters unavailable: {e}")
+    return count_priorities(collection)
+
+def format_distribution(counts: Dict[str, int]) -> str:
+    """Known priorities first, then any other values found"""
+    names = PRIORITY_ORDER + sorted(k for k in counts if k not in PRIORITY_ORDER + ["total", "unanalyzed"])
+    return " ".join(f"{name}:{counts.get(name, 0)}" for name in names)
 
 # -----------------------------
-# 7. Health Check & Monitoring
+# 10. Health Check & Monitoring
 # -----------------------------
+def update_queue_lag() -> Dict[str, float]:
+    """Queue-lag gauge: now minus createdAt of the oldest pending document"""
+    now = datetime.utcnow()
+    lags = {}
+    for collection in (emails_col, tickets_col):
+        try:
+            oldest = collection.find_one(
+                {"priority": "pending", "sentiment_analyzed": {"$ne": True}},
+                {"createdAt": 1},
+                sort=[("createdAt", pymongo.ASCENDING)]
+            )
+            created_at = oldest.get("createdAt") if oldest else None
+            lag = (now - created_at).total_seconds() if created_at else 0.0
+            lags[collection.name] = max(lag, 0.0)
+            metrics.QUEUE_LAG.set(lags[collection.name], collection=collection.name)
+        except Exception as e:
+            logger.debug(f"Queue lag for {collection.name} unavailable: {e}")
+    return lags
+
+def check_query_plans():
+    """Explain the hot queries once at startup; warnings name any an index does not serve"""
+    claimable = {**claimable_filter(datetime.utcnow()), **shard_filter()}
+    for collection in (emails_col, tickets_col):
+        indexes.check_query("pending fetch", collection, claimable, [("createdAt", 1)], BATCH_SIZE)
+        indexes.check_query("claim read-back", collection, {"claim_token": ObjectId()})
+        indexes.check_query("unanalyzed count", collection, {"priority": "pending", "sentiment_analyzed": {"$ne": True}})
+    if FAIR_SHARE:
+        indexes.check_query("mailbox fetch", emails_col, {**claimable, "mailbox": ObjectId()},
+                            [("createdAt", 1)], BATCH_SIZE)
+    indexes.check_query("linked tickets", tickets_col, {"emailId": {"$in": [ObjectId()]}})
+    indexes.check_query("fallback ticket match", tickets_col,
+                        {"email": "user@example.com", "titleMatchKey": "subject", "priority": "pending"})
+
+def lane_stats() -> str:
+    """Documents per classification lane and outcome since startup"""
+    counts = sorted(metrics.LANE_DOCUMENTS.values.items())
+    return "Lanes " + (" ".join(f"{lane}/{outcome}:{int(count)}" for (lane, outcome), count in counts) or "idle")
+
 def health_check():
     """Health check with detailed status"""
     try:
-        # Email stats
-        email_pending = emails_col.count_documents({
-            "priority": "pending", 
-            "sentiment_analyzed": {"$ne": True}
-        })
-        email_total = emails_col.count_documents({})
-        email_critical = emails_col.count_documents({"priority": "critical"})
-        email_high = emails_col.count_documents({"priority": "high"})
-        email_medium = emails_col.count_documents({"priority": "medium"})
-        email_low = emails_col.count_documents({"priority": "low"})
-        
-        # Ticket stats
-        ticket_pending = tickets_col.count_documents({
-            "priority": "pending", 
-            "sentiment_analyzed": {"$ne": True}
-        })
-        ticket_total = tickets_col.count_documents({})
-        ticket_critical = tickets_col.count_documents({"priority": "critical"})
-        ticket_high = tickets_col.count_documents({"priority": "high"})
-        ticket_medium = tickets_col.count_documents({"priority": "medium"})
-        ticket_low = tickets_col.count_documents({"priority": "low"})
-        
-        logger.info(f"Health: E:{email_pending}/{email_total} T:{ticket_pending}/{ticket_total} | "
-                   f"Priorities E:{email_critical}H:{email_high}M:{email_medium}L:{email_low} | "
-                   f"T:{ticket_critical}H:{ticket_high}M:{ticket_medium}L:{ticket_low}")
+        fair_share.refresh(emails_col, {**claimable_filter(datetime.utcnow()), **shard_filter()})
+        email_counts = read_priority_counts(emails_col)
+        ticket_counts = read_priority_counts(tickets_col)
+        email_pending = email_counts.get("unanalyzed", 0)
+        ticket_pending = ticket_counts.get("unanalyzed", 0)
+        
+        logger.info(f"Health: E:{email_pending}/{email_counts.get('total', 0)} "
+                   f"T:{ticket_pending}/{ticket_counts.get('total', 0)} | "
+                   f"Priorities E:{email_counts.get('critical', 0)}H:{email_counts.get('high', 0)}"
+                   f"M:{email_counts.get('medium', 0)}L:{email_counts.get('low', 0)} | "
+                   f"T:{ticket_counts.get('critical', 0)}H:{ticket_counts.get('high', 0)}"
+                   f"M:{ticket_counts.get('medium', 0)}L:{ticket_counts.get('low', 0)} | "
+                   f"{classification_cache.stats()} | {scheduler.describe()} | {lane_stats()} | "
+                   f"{fair_share.describe()}")
         
         return email_pending + ticket_pending
         
@@ -457,49 +1573,199 @@ def health_check():
 def print_stats():
     """Print detailed statistics"""
     try:
-        # Email priority distribution
-        email_stats = emails_col.aggregate([
-            {"$group": {"_id": "$priority", "count": {"$sum": 1}}},
-            {"$sort": {"_id": 1}}
-        ]).next()
-        
-        # Ticket priority distribution
-        ticket_stats = tickets_col.aggregate([
-            {"$group": {"_id": "$priority", "count": {"$sum": 1}}},
-            {"$sort": {"_id": 1}}
-        ]).next()
-        
-        logger.info(f"STATS - Emails: {dict(email_stats)} | Tickets: {dict(ticket_stats)}")
+        email_counts = read_priority_counts(emails_col)
+        ticket_counts = read_priority_counts(tickets_col)
+        logger.info(f"STATS - Emails ({email_counts.get('total', 0)}): {format_distribution(email_counts)} | "
+                    f"Tickets ({ticket_counts.get('total', 0)}): {format_distribution(ticket_counts)}")
         
     except Exception as e:
         logger.error(f"Stats collection failed: {e}")
 
 # -----------------------------
-# 8. Main Scheduler
+# 11. Change Stream Watcher
+# -----------------------------
+# "watch" tails inserts via a change stream, "poll" keeps the 5 second scheduler
+WORKER_MODE = os.environ.get("EMAIL_WORKER_MODE", "watch").lower()
+RESUME_TOKEN_ID = "email_worker_change_stream"
+RESUME_TOKEN_SAVE_EVERY = 50
+# While idle the token still moves with cluster time; it is saved at most this often
+RESUME_TOKEN_IDLE_SAVE_SECONDS = 60
+
+# Server error codes: standalone mongod, resume token no longer in the oplog
+CHANGE_STREAM_UNSUPPORTED = {40573}
+CHANGE_STREAM_HISTORY_LOST = {260, 280, 286}
+
+WATCH_PIPELINE = [
+    {"$match": {
+        "ns.coll": {"$in": ["emailmessages", "tickets"]},
+        "$or": [
+            {"operationType": "insert", "fullDocument.priority": "pending"},
+            # IMAP re-import resets existing emails back to pending
+            {"operationType": "update", "updateDescription.updatedFields.priority": "pending"}
+        ]
+    }}
+]
+
+def load_resume_token():
+    """Load the last saved change stream resume token, if any"""
+    state = worker_state_col.find_one({"_id": RESUME_TOKEN_ID})
+    return state.get("resume_token") if state else None
+
+def save_resume_token(token):
+    """Persist the change stream resume token so a restart picks up where it stopped"""
+    worker_state_col.update_one(
+        {"_id": RESUME_TOKEN_ID},
+        {"$set": {"resume_token": token, "updated_at": datetime.utcnow()}},
+        upsert=True
+    )
+
+def clear_resume_token():
+    """Forget the saved resume token"""
+    worker_state_col.delete_one({"_id": RESUME_TOKEN_ID})
+
+def handle_change(change: Dict[str, Any]):
+    """Classify the document carried by a single change event"""
+    doc = change.get("fullDocument")
+    if not doc or doc.get("priority") != "pending" or doc.get("sentiment_analyzed"):
+        return
+    
+    # Several workers see the same event; only the one winning the lease classifies it
+    start_time = time.perf_counter()
+    if change["ns"]["coll"] == "emailmessages":
+        email_doc = claim_one(emails_col, doc["_id"], EmailRecord)
+        if email_doc:
+            process_claimed_emails([email_doc], start_time)
+    else:
+        ticket_doc = claim_one(tickets_col, doc["_id"], TicketRecord)
+        if ticket_doc:
+            process_claimed_tickets([ticket_doc], start_time)
+
+def watch_pending():
+    """Tail pending emails and tickets until the stream closes"""
+    token = load_resume_token()
+    if token:
+        logger.info("Resuming change stream from saved token")
+    
+    with db.watch(
+        WATCH_PIPELINE,
+        full_document="updateLookup",
+        resume_after=token,
+        max_await_time_ms=1000
+    ) as stream:
+        logger.info("👀 Watching emailmessages and tickets for pending documents...")
+        unsaved = 0
+        saved_at = time.monotonic()
+        
+        while stream.alive:
+            change = stream.try_next()
+            if change is not None:
+                # Change events are the watch mode's cycles
+                profiler.before_cycle()
+                try:
+                    handle_change(change)
+                except Exception as e:
+                    logger.error(f"Error handling change {change.get('documentKey')}: {e}")
+                finally:
+                    profiler.after_cycle()
+                unsaved += 1
+            
+            # Save once handled events go idle or every N of them; an idle stream only
+            # every RESUME_TOKEN_IDLE_SAVE_SECONDS so a quiet worker leaves Mongo alone
+            if stream.resume_token and stream.resume_token != token:
+                if unsaved:
+                    due = change is None or unsaved >= RESUME_TOKEN_SAVE_EVERY
+                else:
+                    due = time.monotonic() - saved_at >= RESUME_TOKEN_IDLE_SAVE_SECONDS
+                if due:
+                    token = stream.resume_token
+                    save_resume_token(token)
+                    unsaved = 0
+                    saved_at = time.monotonic()
+            
+            schedule.run_pending()
+
+def run_watch_loop() -> bool:
+    """
+    Run the change stream watcher with a slow polling sweep as a safety net.
+    Returns False when change streams are not available on this deployment.
+    """
+    schedule.every(60).seconds.do(drain_backlog).tag("sweep")
+    scheduler.mode = "watching"
+    
+    while True:
+        try:
+            watch_pending()
+        except pymongo.errors.OperationFailure as e:
+            if e.code in CHANGE_STREAM_UNSUPPORTED:
+                logger.warning(f"Change streams not available ({e}) - falling back to polling")
+                schedule.clear("sweep")
+                return False
+            if e.code in CHANGE_STREAM_HISTORY_LOST:
+                logger.warning(f"Resume token no longer valid ({e}) - draining backlog and restarting stream")
+                clear_resume_token()
+                drain_backlog(float("inf"), run_jobs=True)
+                continue
+            raise
+        except pymongo.errors.ConnectionFailure as e:
+            logger.warning(f"Change stream connection lost: {e} - retrying in 5s")
+            time.sleep(5)
+
+def run_polling_loop():
+    """Backlog-aware polling: drain backlogs as they appear, exponential back-off while idle"""
+    logger.info(f"⏰ Adaptive polling: {CYCLE_CAPACITY} documents per cycle, idle back-off up to {IDLE_DELAY_MAX:.0f}s")
+    
+    while True:
+        schedule.run_pending()
+        processed = process_all_pending()
+        if scheduler.cycle_full:
+            # A full cycle means a backlog: drain it (through the pipeline when enabled)
+            processed += drain_backlog(float("inf"), run_jobs=True)
+        delay = scheduler.record(processed)
+        if delay:
+            time.sleep(delay)
+
+# -----------------------------
+# 12. Main Scheduler
 # -----------------------------
 def run_scheduler():
     """Main scheduler loop"""
     logger.info("🚀 Starting Python NLP Priority Classifier Service...")
     logger.info("📊 Monitoring emails and tickets for pending priority analysis...")
     logger.info("🔍 Using schema: priority, sentiment_analyzed, priority_updated_at")
-    logger.info("⏰ Processing every 5 seconds | Health checks every 30 seconds")
+    logger.info(f"⏰ Mode: {WORKER_MODE} | Health checks every 30 seconds")
     
     # Schedule jobs
-    schedule.every(5).seconds.do(process_all_pending)
     schedule.every(30).seconds.do(health_check)
+    schedule.every(5).seconds.do(backfill_title_match_keys)
+    schedule.every(RECONCILE_SECONDS).seconds.do(reconcile_priority_counts)
     schedule.every(60).seconds.do(print_stats)
+    schedule.every(15).seconds.do(update_queue_lag)
+    schedule.every(5).seconds.do(profiler.expire)
+    
+    # The startup drain and reconcile already run the hot queries
+    indexes.ensure_indexes(db)
+    check_query_plans()
+    
+    # Counters start from the real distribution; later writes adjust them
+    reconcile_priority_counts()
+    update_queue_lag()
+    metrics.start_server()
     
-    # Initial run
-    logger.info("🔄 Running initial processing cycle...")
-    process_all_pending()
+    # Pool processes import and warm up TextBlob before the first batch
+    start_classifier_pool()
+    profiler.install()
+    
+    # Initial run drains anything queued while the worker was down
+    logger.info("🔄 Draining anything queued while the worker was down...")
+    drain_backlog(float("inf"), run_jobs=True)
     
     try:
         logger.info("✅ Service started successfully - press Ctrl+C to stop")
         logger.info("📈 Watch for processing logs and health checks...")
         
-        while True:
-            schedule.run_pending()
-            time.sleep(1)
+        if WORKER_MODE == "watch":
+            run_watch_loop()
+        run_polling_loop()
             
     except KeyboardInterrupt:
         logger.info("🛑 Received shutdown signal - stopping gracefully...")
@@ -507,18 +1773,29 @@ def run_scheduler():
         logger.error(f"❌ Unexpected scheduler error: {e}")
         logger.error(f"Traceback: {traceback.format_exc()}")
     finally:
+        stop_classifier_pool()
+        metrics.stop_server()
         if mongo_client:
             mongo_client.close()
         logger.info("👋 Service shutdown complete")
+        worker_logging.stop_logging()
 
 # -----------------------------
-# 9. Entry Point
+# 13. Entry Point
 # -----------------------------
 if __name__ == "__main__":
+    setup_logging()
+    try:
+        init_connections()
+    except Exception as e:
+        logger.error(f"Failed to connect to MongoDB: {e}")
+        sys.exit(1)
+    
     try:
         # Validate dependencies
         logger.info("🔍 Checking dependencies...")
-        logger.info(f"TextBlob version: {TextBlob}")
+        logger.info(f"Sentiment engine: {SENTIMENT_ENGINE} | Classification pool size: {POOL_SIZE}")
+        logger.info(f"Worker id: {WORKER_ID} | Lease: {LEASE_SECONDS}s | Shard: {SHARD_INDEX}/{SHARD_COUNT}")
         logger.info(f"PyMongo version: {pymongo.version}")
         
         # Start the service
@@ -526,7 +1803,7 @@ if __name__ == "__main__":
         
     except ImportError as e:
         logger.error(f"❌ Missing required package: {e}")
-        logger.error("💡 Install with: pip install pymongo textblob redis schedule")
+        logger.error("💡 Install with: pip install pymongo textblob redis schedule (numpy for the lexicon engine)")
         sys.exit(1)
     except Exception as e:
         logger.error(f"❌ Service startup failed: {e}")
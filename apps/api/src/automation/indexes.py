@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Worker Indexes
+Indexes the worker's own queries depend on, created at startup if they
+are missing, and an explain() check of the hot queries that warns when
+one of them scans the whole collection or sorts in memory.
+
+The model indexes ({priority: 1, sentiment_analyzed: 1}) cannot serve the
+oldest-first pending fetch: `sentiment_analyzed: {$ne: true}` is a poor
+index predicate and the sort needs createdAt. The partial indexes below
+only hold pending documents, so they stay small as the collections grow.
+"""
+
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+PENDING = {"priority": "pending"}
+CLAIMED = {"claim_token": {"$exists": True}}
+
+# collection -> [(keys, options)]; unnamed entries match the Mongoose model indexes
+WORKER_INDEXES = {
+    "emailmessages": [
+        # Pending fetch, queue lag and the unanalyzed count
+        ([("createdAt", 1)], {"name": "worker_pending_createdAt", "partialFilterExpression": PENDING}),
+        # Per-mailbox fair-share fetch
+        ([("mailbox", 1), ("createdAt", 1)],
+         {"name": "worker_pending_mailbox_createdAt", "partialFilterExpression": PENDING}),
+        # Sharded workers: pending fetch of their own buckets, and stamping of new documents
+        ([("shard_bucket", 1), ("createdAt", 1)],
+         {"name": "worker_pending_shard_createdAt", "partialFilterExpression": PENDING}),
+        ([("mailbox", 1), ("shard_bucket", 1), ("createdAt", 1)],
+         {"name": "worker_pending_mailbox_shard_createdAt", "partialFilterExpression": PENDING}),
+        # Read-back of linked claims; only leased documents carry a token
+        ([("claim_token", 1)], {"name": "worker_claim_token", "partialFilterExpression": CLAIMED}),
+        ([("ticketId", 1)], {}),
+    ],
+    "tickets": [
+        ([("createdAt", 1)], {"name": "worker_pending_createdAt", "partialFilterExpression": PENDING}),
+        ([("shard_bucket", 1), ("createdAt", 1)],
+         {"name": "worker_pending_shard_createdAt", "partialFilterExpression": PENDING}),
+        ([("claim_token", 1)], {"name": "worker_claim_token", "partialFilterExpression": CLAIMED}),
+        # Tickets linked to claimed emails
+        ([("emailId", 1)], {"name": "worker_emailId"}),
+        # Fallback email-to-ticket match
+        ([("email", 1), ("titleMatchKey", 1), ("priority", 1)], {}),
+    ],
+}
+
+def ensure_indexes(db) -> int:
+    """Create any missing worker index; returns how many could not be created"""
+    failures = 0
+    for collection_name, indexes in WORKER_INDEXES.items():
+        collection = db[collection_name]
+        for keys, options in indexes:
+            try:
+                collection.create_index(keys, **options)
+            except OperationFailure as e:
+                # Usually the same keys under another name or options; the query check shows whether it serves
+                failures += 1
+                logger.warning(f"Index {collection_name} {keys} not created: {e}")
+    logger.info(f"Worker indexes checked ({failures} not created)")
+    return failures
+
+def plan_stages(plan: Any) -> List[str]:
+    """Every stage name in an explain() plan tree, whatever its nesting"""
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(plan_stages(value))
+    return stages
+
+def check_query(name: str, collection, query: Dict[str, Any],
+                sort: Optional[List[Tuple[str, int]]] = None, limit: int = 0) -> Optional[List[str]]:
+    """Explain one query and warn on a collection scan or an in-memory sort; returns the winning plan's stages"""
+    try:
+        cursor = collection.find(query, {"_id": 1})
+        if sort:
+            cursor = cursor.sort(sort)
+        if limit:
+            cursor = cursor.limit(limit)
+        explain = cursor.explain()
+    except Exception as e:
+        logger.info(f"Query plan check skipped for {name}: {e}")
+        return None
+
+    stages = plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {}))
+    problems = []
+    if "COLLSCAN" in stages:
+        problems.append("COLLSCAN")
+    if "SORT" in stages:
+        problems.append("in-memory SORT")
+    if problems:
+        logger.warning(f"⚠️ Query plan for {name} on {collection.name} uses {' and '.join(problems)} "
+                       f"({' > '.join(stages)}) - check the worker indexes")
+    else:
+        logger.info(f"Query plan for {name}: {' > '.join(stages)}")
+    return stages
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Keyword Tier Matcher
+Compiles the priority keyword tiers once into a word-bounded matcher
+that finds the highest tier in a single pass over the text
+"""
+
+import os
+import re
+import json
+import time
+import string
+import hashlib
+import logging
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+KEYWORDS_PATH = os.environ.get(
+    "EMAIL_WORKER_KEYWORDS",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "priority_keywords.json")
+)
+# Seconds between checks of the config file's mtime
+RELOAD_CHECK_INTERVAL = 5.0
+
+# Highest tier first
+TIER_ORDER = ["critical", "high", "medium"]
+
+WORD_RE = re.compile(r"\w+")
+# Turns ASCII punctuation into separators so str.split() yields \w tokens
+PUNCTUATION_TABLE = str.maketrans({c: " " for c in string.punctuation if c != "_"})
+
+def tokenize(text: str) -> List[str]:
+    """Split text into word tokens, using the fast path for ASCII text"""
+    if text.isascii():
+        return text.translate(PUNCTUATION_TABLE).split()
+    return WORD_RE.findall(text)
+
+class KeywordMatcher:
+    """
+    Word-bounded multi-keyword matcher over priority tiers.
+    The text is tokenized once and intersected with the set of keyword start
+    words at C speed; only phrases whose first word occurs are verified
+    with their own word-bounded regex.
+    """
+
+    def __init__(self, tiers: Dict[str, List[str]], version: str = ""):
+        self.version = version
+        rank_by_keyword = {}
+        for rank, tier in enumerate(TIER_ORDER):
+            for keyword in tiers.get(tier, []):
+                keyword = " ".join(keyword.lower().split())
+                if keyword:
+                    rank_by_keyword.setdefault(keyword, rank)
+        
+        # first token -> [(rank, phrase regex or None for single words)], best rank first
+        self.candidates = {}
+        for keyword, rank in rank_by_keyword.items():
+            tokens = tokenize(keyword)
+            if not tokens:
+                continue
+            phrase = None
+            if tokens != [keyword]:
+                phrase = re.compile(rf"(?<!\w){re.escape(keyword)}(?!\w)")
+            self.candidates.setdefault(tokens[0], []).append((rank, phrase))
+        for entries in self.candidates.values():
+            entries.sort(key=lambda entry: entry[0])
+        self.first_tokens = frozenset(self.candidates)
+
+    def match(self, text: str) -> Optional[str]:
+        """Return the highest keyword tier in lowercased text, or None"""
+        hits = self.first_tokens.intersection(tokenize(text))
+        if not hits:
+            return None
+        
+        best = len(TIER_ORDER)
+        for token in hits:
+            for rank, phrase in self.candidates[token]:
+                if rank >= best:
+                    break
+                if phrase is None or phrase.search(text):
+                    best = rank
+                    break
+            if best == 0:
+                break
+        return TIER_ORDER[best] if best < len(TIER_ORDER) else None
+
+def load_matcher(path: str = KEYWORDS_PATH) -> KeywordMatcher:
+    """Load and compile keyword tiers from a JSON config file"""
+    with open(path, "rb") as f:
+        raw = f.read()
+    tiers = json.loads(raw.decode("utf-8"))
+    unknown = set(tiers) - set(TIER_ORDER)
+    if unknown:
+        raise ValueError(f"Unknown keyword tiers in {path}: {sorted(unknown)}")
+    version = hashlib.sha1(raw).hexdigest()[:12]
+    return KeywordMatcher(tiers, version)
+
+_matcher = None
+_matcher_mtime = None
+_last_check = 0.0
+
+def get_matcher() -> KeywordMatcher:
+    """Return the compiled matcher, reloading it when the config file changed"""
+    global _matcher, _matcher_mtime, _last_check
+    
+    now = time.monotonic()
+    if _matcher is not None and now - _last_check < RELOAD_CHECK_INTERVAL:
+        return _matcher
+    _last_check = now
+    
+    try:
+        mtime = os.stat(KEYWORDS_PATH).st_mtime
+        if _matcher is None or mtime != _matcher_mtime:
+            matcher = load_matcher(KEYWORDS_PATH)
+            if _matcher is not None:
+                logger.info(f"Keyword tiers reloaded (version {matcher.version})")
+            _matcher, _matcher_mtime = matcher, mtime
+    except Exception as e:
+        if _matcher is None:
+            raise
+        logger.error(f"Failed to reload keyword tiers from {KEYWORDS_PATH}: {e} (keeping version {_matcher.version})")
+    
+    return _matcher
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Worker Metrics
+Counters, gauges and histograms kept in process and served over a local
+HTTP endpoint in the Prometheus text exposition format.
+"""
+
+import os
+import threading
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+METRICS_HOST = os.environ.get("EMAIL_WORKER_METRICS_HOST", "127.0.0.1")
+# 0 disables the endpoint
+METRICS_PORT = int(os.environ.get("EMAIL_WORKER_METRICS_PORT", "9108"))
+
+# Seconds; covers a single cached lookup up to a slow sentiment batch
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+
+def _escape(value: str) -> str:
+    """Label value escaping of the text exposition format (mailbox names are user-chosen)"""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _label_text(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    """Base for labelled metrics; values are keyed by label value tuples"""
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.values = {}
+
+    def _key(self, label_values: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(label_values.get(name, "")) for name in self.labels)
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_label_text(self.labels, key)} {_format_value(value)}"
+                for key, value in sorted(self.values.items())]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **label_values):
+        key = self._key(label_values)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **label_values):
+        with _lock:
+            self.values[self._key(label_values)] = value
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value: float, **label_values):
+        key = self._key(label_values)
+        with _lock:
+            # [per-bucket counts..., sum, count]
+            state = self.values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, state in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_label_text(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{_label_text(self.labels, key)} {state[-1]}")
+        return lines
+
+# -----------------------------
+# Worker metrics
+# -----------------------------
+STAGE_SECONDS = Histogram(
+    "email_worker_stage_seconds",
+    "Time spent per batch in each processing stage",
+    ("stage",)
+)
+DOCUMENTS = Counter(
+    "email_worker_documents_total",
+    "Documents processed, by collection and result",
+    ("collection", "result")
+)
+THROUGHPUT = Gauge(
+    "email_worker_documents_per_second",
+    "Documents classified per second in the last batch",
+    ("collection",)
+)
+QUEUE_LAG = Gauge(
+    "email_worker_queue_lag_seconds",
+    "Age of the oldest pending document",
+    ("collection",)
+)
+STAGE_UTILIZATION = Gauge(
+    "email_worker_stage_utilization",
+    "Share of the last pipeline run each stage spent working",
+    ("stage",)
+)
+LANE_DOCUMENTS = Counter(
+    "email_worker_lane_documents_total",
+    "Documents by classification lane (fast, sentiment) and outcome",
+    ("lane", "outcome")
+)
+MAILBOX_BACKLOG = Gauge(
+    "email_worker_mailbox_backlog",
+    "Claimable pending emails per mailbox",
+    ("mailbox",)
+)
+MAILBOX_LAG = Gauge(
+    "email_worker_mailbox_lag_seconds",
+    "Age of the oldest pending email per mailbox",
+    ("mailbox",)
+)
+
+REGISTRY = [STAGE_SECONDS, DOCUMENTS, THROUGHPUT, QUEUE_LAG, STAGE_UTILIZATION, LANE_DOCUMENTS,
+            MAILBOX_BACKLOG, MAILBOX_LAG]
+
+def render() -> str:
+    """Every registered metric in the text exposition format"""
+    with _lock:
+        return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would drown the worker log
+        pass
+
+_server = None
+
+def start_server(host: str = METRICS_HOST, port: int = METRICS_PORT):
+    """Serve /metrics from a daemon thread; returns the server or None when disabled"""
+    global _server
+    if port <= 0 or _server is not None:
+        return _server
+    try:
+        _server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        logger.warning(f"Metrics endpoint not started on {host}:{port}: {e}")
+        return None
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+    logger.info(f"Metrics endpoint: http://{host}:{port}/metrics")
+    return _server
+
+def stop_server():
+    global _server
+    if _server is not None:
+        _server.shutdown()
+        _server.server_close()
+        _server = None
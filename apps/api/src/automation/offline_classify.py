@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Offline Batch Classifier
+Classifies a mongodump .bson file or a JSONL export (mongoexport) of
+emails or tickets without any database. The export is memory-mapped and
+split into byte ranges on record boundaries; every process maps the file
+itself and decodes records straight from the map, so no document is
+copied between processes. Results go to a tab-separated file:
+
+    id  priority  path  latency_us
+
+where path is keyword, sentiment, empty or failed. Documents are
+classified like the worker does: emails from subject + normalized body,
+tickets from title + normalized detail.
+
+Usage: python offline_classify.py <export.bson|export.jsonl> [--output results.tsv]
+                                  [--workers N] [--format auto] [--kind auto]
+"""
+
+import os
+import sys
+import json
+import mmap
+import time
+import struct
+import logging
+import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import bson
+
+import classifier
+from text_normalizer import normalize_body
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# kind -> (subject field, body field, body normalizer)
+KINDS = {
+    "email": ("subject", "body", normalize_body),
+    "ticket": ("title", "detail", normalize_body),
+}
+# Byte ranges per worker process, so one slow range does not hold up the run
+RANGES_PER_WORKER = 4
+BSON_LENGTH = struct.Struct("<i")
+
+# -----------------------------
+# 1. Export Ranges
+# -----------------------------
+def detect_format(path: str) -> str:
+    return "bson" if path.endswith(".bson") else "jsonl"
+
+def bson_ranges(view: mmap.mmap, parts: int) -> List[Tuple[int, int]]:
+    """Split a BSON dump into about `parts` byte ranges, walking only the length prefixes"""
+    size = len(view)
+    target = max(size // max(parts, 1), 1)
+    ranges = []
+    start = pos = 0
+    while pos < size:
+        if pos + 4 > size:
+            raise ValueError(f"truncated BSON export at byte {pos}")
+        length = BSON_LENGTH.unpack_from(view, pos)[0]
+        if length < 5 or pos + length > size:
+            raise ValueError(f"corrupt BSON record at byte {pos} (length {length})")
+        pos += length
+        if pos - start >= target:
+            ranges.append((start, pos))
+            start = pos
+    if start < size:
+        ranges.append((start, size))
+    return ranges
+
+def jsonl_ranges(size: int, parts: int) -> List[Tuple[int, int]]:
+    """Equal byte ranges; each range owns the lines that start inside it"""
+    step = max(size // max(parts, 1), 1)
+    return [(start, min(start + step, size)) for start in range(0, size, step)]
+
+def iter_bson(view: mmap.mmap, start: int, end: int) -> Iterator[Dict[str, Any]]:
+    records = memoryview(view)
+    try:
+        pos = start
+        while pos < end:
+            length = BSON_LENGTH.unpack_from(view, pos)[0]
+            # Decoded from a view of the map: no bytes copy per record
+            yield bson.decode(records[pos:pos + length])
+            pos += length
+    finally:
+        records.release()
+
+def iter_jsonl(view: mmap.mmap, start: int, end: int) -> Iterator[Optional[Dict[str, Any]]]:
+    size = len(view)
+    # A line belongs to the range it starts in
+    pos = 0 if start == 0 else view.find(b"\n", start - 1) + 1
+    if start and not pos:
+        return
+    while pos < end:
+        line_end = view.find(b"\n", pos)
+        if line_end < 0:
+            line_end = size
+        # json needs bytes, so each line is sliced out of the map
+        line = view[pos:line_end].strip()
+        if line:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+        pos = line_end + 1
+
+# -----------------------------
+# 2. Classification
+# -----------------------------
+def document_id(doc: Dict[str, Any]) -> str:
+    doc_id = doc.get("_id", "")
+    # Extended JSON from mongoexport: {"_id": {"$oid": "..."}}
+    if isinstance(doc_id, dict):
+        doc_id = doc_id.get("$oid", doc_id)
+    return str(doc_id)
+
+def document_kind(doc: Dict[str, Any], kind: str) -> str:
+    if kind != "auto":
+        return kind
+    return "ticket" if "title" in doc or "detail" in doc else "email"
+
+def classify_document(doc: Dict[str, Any], kind: str) -> Tuple[str, str, float]:
+    """(priority, path, seconds) for one exported email or ticket"""
+    start_time = time.perf_counter()
+    subject_field, body_field, normalize = KINDS[document_kind(doc, kind)]
+    body = doc.get(body_field) or ""
+    if normalize and isinstance(body, str):
+        body = normalize(body)
+    text = f"{doc.get(subject_field) or ''} {body}".lower().strip()
+
+    if not text:
+        return 'low', 'empty', time.perf_counter() - start_time
+    keyword_tier = classifier.match_keywords([text])[0]
+    if keyword_tier:
+        return keyword_tier, 'keyword', time.perf_counter() - start_time
+    priority = classifier.score_texts_timed([text], budget=0)[0][0]
+    path = 'sentiment' if priority else 'failed'
+    return priority or 'low', path, time.perf_counter() - start_time
+
+def classify_range(path: str, export_format: str, kind: str, start: int, end: int, output: str) -> Dict[str, Any]:
+    """Pool task: classify the records of one byte range into its own part file"""
+    priorities = Counter()
+    paths = Counter()
+    latency = 0.0
+    invalid = 0
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+        records = iter_bson(view, start, end) if export_format == "bson" else iter_jsonl(view, start, end)
+        try:
+            with open(output, "w", encoding="utf-8") as out:
+                for doc in records:
+                    if not isinstance(doc, dict):
+                        invalid += 1
+                        continue
+                    priority, taken, seconds = classify_document(doc, kind)
+                    out.write(f"{document_id(doc)}\t{priority}\t{taken}\t{seconds * 1e6:.0f}\n")
+                    priorities[priority] += 1
+                    paths[taken] += 1
+                    latency += seconds
+        finally:
+            # Release the record views before the map closes
+            records.close()
+    return {"priorities": priorities, "paths": paths, "latency": latency, "invalid": invalid}
+
+# -----------------------------
+# 3. Main
+# -----------------------------
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="mongodump .bson file or JSONL export")
+    parser.add_argument("--output", help="results file (default: <input>.priorities.tsv)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--format", choices=["auto", "bson", "jsonl"], default="auto")
+    parser.add_argument("--kind", choices=["auto", "email", "ticket"], default="auto",
+                        help="auto: documents with title/detail are tickets")
+    args = parser.parse_args()
+
+    export_format = detect_format(args.input) if args.format == "auto" else args.format
+    output = args.output or f"{args.input}.priorities.tsv"
+    if os.path.getsize(args.input) == 0:
+        sys.exit(f"{args.input} is empty")
+
+    with open(args.input, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+        parts = args.workers * RANGES_PER_WORKER
+        try:
+            ranges = bson_ranges(view, parts) if export_format == "bson" else jsonl_ranges(len(view), parts)
+        except ValueError as e:
+            sys.exit(f"{args.input}: {e}")
+
+    logger.info(f"Classifying {args.input} ({export_format}, {len(ranges)} ranges) with {args.workers} processes "
+                f"| classifier {classifier.classifier_version()}")
+    start_time = time.perf_counter()
+    part_paths = [f"{output}.part{i}" for i in range(len(ranges))]
+    priorities = Counter()
+    paths = Counter()
+    latency = 0.0
+    invalid = 0
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=classifier.warm_up) as pool:
+            futures = [
+                pool.submit(classify_range, args.input, export_format, args.kind, start, end, part_path)
+                for (start, end), part_path in zip(ranges, part_paths)
+            ]
+            for future in futures:
+                result = future.result()
+                priorities.update(result["priorities"])
+                paths.update(result["paths"])
+                latency += result["latency"]
+                invalid += result["invalid"]
+
+        # Parts are joined in range order, so results follow the export's order
+        with open(output, "w", encoding="utf-8") as out:
+            out.write("id\tpriority\tpath\tlatency_us\n")
+            for part_path in part_paths:
+                with open(part_path, encoding="utf-8") as part:
+                    for chunk in iter(lambda: part.read(1 << 20), ""):
+                        out.write(chunk)
+    finally:
+        for part_path in part_paths:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+
+    elapsed = time.perf_counter() - start_time
+    total = sum(paths.values())
+    logger.info(f"Done: {total} documents in {elapsed:.1f}s ({total / max(elapsed, 1e-9):.1f} docs/sec) "
+                f"| mean latency {latency / max(total, 1) * 1e3:.2f}ms | {invalid} invalid records")
+    logger.info("Priorities: " + " ".join(f"{name}:{count}" for name, count in sorted(priorities.items())))
+    logger.info("Paths: " + " ".join(f"{name}:{count}" for name, count in sorted(paths.items())))
+    logger.info(f"Results written to {output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
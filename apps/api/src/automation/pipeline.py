@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Staged Pipeline
+A source stage and any number of processing stages, each on its own
+thread and connected by bounded queues. A full queue blocks the stage
+feeding it, so a slow stage throttles the ones before it instead of
+piling up work. Each stage tracks the time it spends working, which
+gives its utilization over the run.
+"""
+
+import time
+import queue
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of the stream on every queue
+_DONE = object()
+
+class Stage:
+    """One worker thread applying `func` to every item from its input queue"""
+
+    def __init__(self, name: str, func: Callable[[Any], Any]):
+        self.name = name
+        self.func = func
+        self.busy_seconds = 0.0
+        self.items = 0
+        self.errors = 0
+
+    def call(self, *args):
+        start_time = time.perf_counter()
+        try:
+            return self.func(*args)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Pipeline stage {self.name} failed: {e}")
+            return None
+        finally:
+            self.busy_seconds += time.perf_counter() - start_time
+
+class Pipeline:
+    """
+    source() is called repeatedly on the first thread until it returns None or
+    the deadline passes; every item then flows through the stages in order.
+    A stage returning None drops the item.
+    """
+
+    def __init__(self, source: Callable[[], Optional[Any]], stages: List[Stage], queue_size: int = 2):
+        self.source = Stage("read", source)
+        self.stages = stages
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+        self.threads = []
+        self.deadline = None
+        self.started_at = None
+        self.finished_at = None
+        self.stop_event = threading.Event()
+
+    def _read(self):
+        out = self.queues[0]
+        try:
+            while not self.stop_event.is_set() and time.monotonic() < self.deadline:
+                item = self.source.call()
+                if item is None:
+                    break
+                self.source.items += 1
+                out.put(item)
+        finally:
+            out.put(_DONE)
+
+    def _work(self, index: int):
+        stage = self.stages[index]
+        inbox = self.queues[index]
+        outbox = self.queues[index + 1] if index + 1 < len(self.queues) else None
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                break
+            result = stage.call(item)
+            stage.items += 1
+            if result is not None and outbox is not None:
+                outbox.put(result)
+        if outbox is not None:
+            outbox.put(_DONE)
+
+    def start(self, max_seconds: float):
+        self.deadline = time.monotonic() + max_seconds
+        self.started_at = time.perf_counter()
+        self.threads = [threading.Thread(target=self._read, name="pipeline-read", daemon=True)]
+        self.threads += [
+            threading.Thread(target=self._work, args=(i,), name=f"pipeline-{stage.name}", daemon=True)
+            for i, stage in enumerate(self.stages)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        """Stop reading; items already read still drain through the stages"""
+        self.stop_event.set()
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Wait for every stage; returns True once the pipeline has finished"""
+        end = None if timeout is None else time.monotonic() + timeout
+        for thread in self.threads:
+            remaining = None if end is None else max(0.0, end - time.monotonic())
+            thread.join(remaining)
+            if thread.is_alive():
+                return False
+        if self.finished_at is None:
+            self.finished_at = time.perf_counter()
+        return True
+
+    def utilization(self) -> Dict[str, float]:
+        """Share of the run each stage spent working (1.0 = never idle)"""
+        wall = (self.finished_at or time.perf_counter()) - self.started_at
+        if wall <= 0:
+            return {}
+        return {stage.name: stage.busy_seconds / wall for stage in [self.source] + self.stages}
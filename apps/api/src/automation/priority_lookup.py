@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Priority Lookup
+Bulk read-through lookup of email and ticket priorities for queue views
+and dashboards. All ids are read with one Redis MGET over the
+priority_email:<id> / priority_ticket:<id> keys the worker writes; misses
+are resolved with one $in query per collection and written back to Redis.
+
+Usage: python priority_lookup.py --emails <id,id,...> --tickets <id,id,...>
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+
+from bson import ObjectId
+
+logger = logging.getLogger(__name__)
+
+# Backfilled entries live shorter than the worker's, since edits made
+# through the API do not touch the cache
+LOOKUP_CACHE_TTL = int(os.environ.get("EMAIL_WORKER_LOOKUP_CACHE_TTL", "300"))
+# Lookups kept for the latency percentiles
+LATENCY_WINDOW = 1000
+
+# kind -> (collection name, Redis key prefix)
+KINDS = {
+    "emails": ("emailmessages", "priority_email"),
+    "tickets": ("tickets", "priority_ticket"),
+}
+
+class PriorityLookup:
+    """Redis first, one batched MongoDB query for the rest"""
+
+    def __init__(self, db, redis_client=None, cache_ttl: int = LOOKUP_CACHE_TTL):
+        self.db = db
+        self.redis_client = redis_client
+        self.cache_ttl = cache_ttl
+        self.hits = 0
+        self.misses = 0
+        self.not_found = 0
+        self.lookups = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def lookup(self, email_ids: Iterable = (), ticket_ids: Iterable = ()) -> Dict[str, Dict[str, Optional[str]]]:
+        """
+        Priorities by id for {"emails": {...}, "tickets": {...}}.
+        Ids that are invalid or not found map to None.
+        """
+        start_time = time.perf_counter()
+        requested = {"emails": [str(i) for i in email_ids], "tickets": [str(i) for i in ticket_ids]}
+        result = {kind: dict.fromkeys(ids) for kind, ids in requested.items()}
+
+        keys = [(kind, doc_id) for kind, ids in requested.items() for doc_id in dict.fromkeys(ids)]
+        cached = self._mget(keys)
+
+        missing = {"emails": [], "tickets": []}
+        for (kind, doc_id), priority in zip(keys, cached):
+            if priority is not None:
+                result[kind][doc_id] = priority
+                self.hits += 1
+            else:
+                missing[kind].append(doc_id)
+                self.misses += 1
+
+        backfill = {}
+        for kind, doc_ids in missing.items():
+            found = self._from_mongo(kind, doc_ids)
+            result[kind].update(found)
+            self.not_found += len(doc_ids) - len(found)
+            prefix = KINDS[kind][1]
+            backfill.update({f"{prefix}:{doc_id}": priority for doc_id, priority in found.items()})
+        self._backfill(backfill)
+
+        self.lookups += 1
+        self.latencies.append(time.perf_counter() - start_time)
+        return result
+
+    def _mget(self, keys: List) -> List[Optional[str]]:
+        if not keys or not self.redis_client:
+            return [None] * len(keys)
+        try:
+            return self.redis_client.mget([f"{KINDS[kind][1]}:{doc_id}" for kind, doc_id in keys])
+        except Exception as e:
+            logger.debug(f"Redis lookup skipped: {e}")
+            return [None] * len(keys)
+
+    def _from_mongo(self, kind: str, doc_ids: List[str]) -> Dict[str, str]:
+        object_ids = [ObjectId(doc_id) for doc_id in doc_ids if ObjectId.is_valid(doc_id)]
+        if not object_ids:
+            return {}
+        collection = self.db[KINDS[kind][0]]
+        return {
+            str(doc["_id"]): doc["priority"]
+            for doc in collection.find({"_id": {"$in": object_ids}}, {"priority": 1})
+            if doc.get("priority")
+        }
+
+    def _backfill(self, entries: Dict[str, str]):
+        if not entries or not self.redis_client:
+            return
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for key, priority in entries.items():
+                pipe.setex(key, self.cache_ttl, priority)
+            pipe.execute()
+        except Exception as e:
+            logger.debug(f"Redis backfill skipped: {e}")
+
+    def stats(self) -> str:
+        """Hit rate and latency over the recent lookups"""
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0.0
+        latencies = sorted(self.latencies)
+        p50 = latencies[len(latencies) // 2] if latencies else 0.0
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else 0.0
+        return (f"Lookup calls:{self.lookups} Hit:{self.hits} Miss:{self.misses} NotFound:{self.not_found} "
+                f"HitRate:{hit_rate:.1%} p50:{p50 * 1e3:.2f}ms p95:{p95 * 1e3:.2f}ms")
+
+def main():
+    from connections import connect_mongo, connect_redis
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--emails", default="", help="comma-separated email ids")
+    parser.add_argument("--tickets", default="", help="comma-separated ticket ids")
+    parser.add_argument("--stats", action="store_true", help="print hit rate and latency to stderr")
+    args = parser.parse_args()
+
+    mongo_client, db = connect_mongo()
+    try:
+        lookup = PriorityLookup(db, connect_redis())
+        result = lookup.lookup(
+            [doc_id for doc_id in args.emails.split(",") if doc_id],
+            [doc_id for doc_id in args.tickets.split(",") if doc_id]
+        )
+        print(json.dumps(result, indent=2))
+        if args.stats:
+            print(lookup.stats(), file=sys.stderr)
+    finally:
+        mongo_client.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+On-Demand Profiler
+Sending SIGUSR1 to the running worker profiles its next processing
+cycles (polling cycles, or handled change events in watch mode) with
+cProfile and tracks memory growth with tracemalloc. The profile is
+written as logs/profile-<timestamp>.pstats and the top functions and
+allocation growth are logged. Until a signal arrives the only cost is a
+flag check per cycle. A profile that has not seen its cycles by the
+deadline is closed by expire(), so tracing never stays on unattended.
+
+Inspect a profile with: python -m pstats logs/profile-<timestamp>.pstats
+"""
+
+import io
+import os
+import time
+import signal
+import pstats
+import logging
+import cProfile
+import tracemalloc
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Cycles covered by one profile, and the most wall time a profile may stay open
+PROFILE_CYCLES = int(os.environ.get("EMAIL_WORKER_PROFILE_CYCLES", "20"))
+PROFILE_MAX_SECONDS = float(os.environ.get("EMAIL_WORKER_PROFILE_MAX_SECONDS", "300"))
+# Functions and allocation sites listed in the log summary
+PROFILE_TOP = int(os.environ.get("EMAIL_WORKER_PROFILE_TOP", "20"))
+PROFILE_DIR = "logs"
+
+class CycleProfiler:
+    """Profiles the cycles between before_cycle()/after_cycle() calls once requested"""
+
+    def __init__(self, cycles: int = PROFILE_CYCLES, max_seconds: float = PROFILE_MAX_SECONDS):
+        self.cycles = cycles
+        self.max_seconds = max_seconds
+        self.requested = False
+        self.profile = None
+        self.remaining = 0
+        self.deadline = 0.0
+        self.started_at = None
+        self.snapshot = None
+        self.owns_tracemalloc = False
+        self.in_cycle = False
+
+    def request(self, signum=None, frame=None):
+        """Signal handler: only sets a flag, the next cycle starts the profile"""
+        self.requested = True
+
+    def install(self, signum=getattr(signal, "SIGUSR1", None)) -> bool:
+        if signum is None:
+            logger.info("On-demand profiling unavailable (no SIGUSR1 on this platform)")
+            return False
+        signal.signal(signum, self.request)
+        logger.info(f"On-demand profiling: kill -USR1 {os.getpid()} profiles the next {self.cycles} cycles")
+        return True
+
+    def before_cycle(self):
+        if self.profile is None:
+            if not self.requested:
+                return
+            self._start()
+        elif time.monotonic() >= self.deadline:
+            self._finish()
+            return
+        self.in_cycle = True
+        self.profile.enable()
+
+    def after_cycle(self):
+        if self.profile is None or not self.in_cycle:
+            return
+        self.profile.disable()
+        self.in_cycle = False
+        self.remaining -= 1
+        if self.remaining <= 0 or time.monotonic() >= self.deadline:
+            self._finish()
+
+    def expire(self):
+        """Close a profile past its deadline; called between cycles, e.g. as a scheduled job"""
+        if self.profile is not None and not self.in_cycle and time.monotonic() >= self.deadline:
+            self._finish()
+
+    def _start(self):
+        self.requested = False
+        self.profile = cProfile.Profile()
+        self.remaining = self.cycles
+        self.deadline = time.monotonic() + self.max_seconds
+        self.started_at = datetime.now()
+        self.owns_tracemalloc = not tracemalloc.is_tracing()
+        if self.owns_tracemalloc:
+            tracemalloc.start()
+        self.snapshot = tracemalloc.take_snapshot()
+        logger.info(f"Profiling the next {self.cycles} cycles (at most {self.max_seconds:.0f}s)")
+
+    def _finish(self):
+        profile, self.profile = self.profile, None
+        cycles_done = self.cycles - self.remaining
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            path = os.path.join(PROFILE_DIR, f"profile-{self.started_at:%Y%m%d-%H%M%S}.pstats")
+            profile.dump_stats(path)
+
+            summary = io.StringIO()
+            pstats.Stats(profile, stream=summary).strip_dirs().sort_stats("cumulative").print_stats(PROFILE_TOP)
+            logger.info(f"Profile of {cycles_done} cycles written to {path}\n{summary.getvalue()}")
+
+            growth = tracemalloc.take_snapshot().compare_to(self.snapshot, "lineno")[:PROFILE_TOP]
+            total = sum(stat.size_diff for stat in growth)
+            lines = "\n".join(f"  {stat}" for stat in growth)
+            logger.info(f"Memory growth over the profile (top {len(growth)} sites, {total / 1024:+.1f} KiB):\n{lines}")
+        except Exception as e:
+            logger.error(f"Writing the profile failed: {e}")
+        finally:
+            self.snapshot = None
+            if self.owns_tracemalloc:
+                tracemalloc.stop()
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Bulk Reclassification
+Pages through emails and tickets by _id, classifies each chunk in one
+call and writes changed priorities back with unordered bulk writes.
+Linked email/ticket pairs are classified from their combined text like
+the worker does, so both sides get the same priority.
+Progress is checkpointed after every chunk so an interrupted run resumes
+where it stopped. Replaces fix_emails.py: documents without a priority
+are classified directly instead of being reset to pending.
+
+Usage: python reclassify.py [--collection both] [--since 2024-01-01] [--until 2024-02-01]
+                            [--mailbox <EmailQueue id or username>] [--pending-only]
+                            [--chunk 500] [--rate 0] [--dry-run] [--restart]
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+
+import pymongo
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+import classifier
+from email_worker import pair_documents, pair_text
+from text_normalizer import normalize_body
+from connections import connect_mongo, connect_redis, MONGO_URI, REDIS_URL
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Same cache lifetime as the worker's priority_email:/priority_ticket: keys
+PRIORITY_CACHE_TTL = 3600
+
+# collection name -> (text fields, Redis cache prefix, body normalizer)
+COLLECTIONS = {
+    "emailmessages": (("subject", "body"), "priority_email", normalize_body),
+    "tickets": (("title", "detail"), "priority_ticket", normalize_body),
+}
+# collection name -> (partner collection, field pointing at the partner, partner field pointing back)
+LINKS = {
+    "emailmessages": ("tickets", "ticketId", "emailId"),
+    "tickets": ("emailmessages", "emailId", "ticketId"),
+}
+
+# -----------------------------
+# 1. Filters & Checkpoints
+# -----------------------------
+def parse_date(value: str) -> datetime:
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected YYYY-MM-DD, got {value!r}")
+
+def resolve_mailbox(db, mailbox: str) -> ObjectId:
+    """EmailQueue id, name or username -> id"""
+    if ObjectId.is_valid(mailbox):
+        return ObjectId(mailbox)
+    queue = db["emailqueues"].find_one({"$or": [{"name": mailbox}, {"username": mailbox}]}, {"_id": 1})
+    if not queue:
+        sys.exit(f"Mailbox not found: {mailbox}")
+    return queue["_id"]
+
+def build_filter(args, mailbox_id=None) -> dict:
+    """Query shared by every page (the _id bound is added per page)"""
+    query = {}
+    if args.since or args.until:
+        query["createdAt"] = {}
+        if args.since:
+            query["createdAt"]["$gte"] = args.since
+        if args.until:
+            query["createdAt"]["$lt"] = args.until
+    if args.pending_only:
+        query["sentiment_analyzed"] = {"$ne": True}
+    if mailbox_id is not None:
+        query["mailbox"] = mailbox_id
+    return query
+
+def filter_signature(args) -> str:
+    """Checkpoints only resume a run with the same selection"""
+    selection = [args.since, args.until, args.mailbox, args.pending_only, classifier.classifier_version()]
+    return hashlib.sha1(repr(selection).encode("utf-8")).hexdigest()[:12]
+
+def load_checkpoint(path: str, signature: str) -> dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        return {}
+    if checkpoint.get("signature") != signature:
+        logger.warning(f"Checkpoint {path} belongs to a different selection or classifier version - starting over")
+        return {}
+    return checkpoint
+
+def save_checkpoint(path: str, checkpoint: dict):
+    """Write via a temp file so a crash never leaves a truncated checkpoint"""
+    checkpoint["updated_at"] = datetime.utcnow().isoformat(timespec="seconds")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_path, path)
+
+# -----------------------------
+# 2. Classification
+# -----------------------------
+def load_partners(collection, docs, partner_query=None) -> list:
+    """Linked emails of a ticket chunk, or linked tickets of an email chunk, with their text fields"""
+    partner_name, link_field, back_field = LINKS[collection.name]
+    partner_fields, _, _ = COLLECTIONS[partner_name]
+    links = [{"_id": {"$in": [doc[link_field] for doc in docs if doc.get(link_field)]}},
+             {back_field: {"$in": [doc["_id"] for doc in docs]}}]
+    query = {"$or": links, **(partner_query or {})}
+    return list(collection.database[partner_name].find(query, dict.fromkeys(partner_fields + (back_field,), 1)))
+
+def classify_docs(docs, fields, normalize=None, collection_name=None, partners=()) -> list:
+    """
+    Priorities for a chunk, classifying identical texts once. Documents
+    linked to one of `partners` are classified from the pair's combined
+    text, as the worker does, so both sides of a pair end up with the same
+    priority whichever collection is reclassified.
+    """
+    subject_field, body_field = fields
+    paired = {}
+    if partners and collection_name == "emailmessages":
+        paired = {email["_id"]: pair_text(email, ticket) for email, ticket in pair_documents(docs, partners)[0]}
+    elif partners:
+        paired = {ticket["_id"]: pair_text(email, ticket) for email, ticket in pair_documents(partners, docs)[0]}
+
+    texts = []
+    for doc in docs:
+        if doc["_id"] in paired:
+            subject, body = paired[doc["_id"]]
+        else:
+            subject = doc.get(subject_field) or ""
+            body = doc.get(body_field) or ""
+            if normalize:
+                body = normalize(body)
+        texts.append(f"{subject} {body}".lower().strip())
+    unique = list(dict.fromkeys(text for text in texts if text))
+    classified = dict(zip(unique, classifier.classify_texts(unique)))
+    return [classified.get(text) or 'low' for text in texts]
+
+# -----------------------------
+# 3. Reclassification
+# -----------------------------
+class RateLimiter:
+    """Sleeps so that documents per second stay at or below `rate` (0 = unlimited)"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.start_time = time.monotonic()
+        self.count = 0
+
+    def wait(self, count: int):
+        self.count += count
+        if self.rate <= 0:
+            return
+        ahead = self.count / self.rate - (time.monotonic() - self.start_time)
+        if ahead > 0:
+            time.sleep(ahead)
+
+def write_chunk(collection, docs, priorities) -> tuple:
+    """
+    Bulk write changed priorities; returns (modified, failed, ids whose
+    priority in Mongo is now the new one: unchanged or actually written)
+    """
+    # BSON keeps milliseconds; the read-back below matches on this exact value
+    now = datetime.utcnow()
+    now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+    ops = []
+    written_ids = []
+    settled = set()
+    for doc, new_priority in zip(docs, priorities):
+        if doc.get("priority") == new_priority and doc.get("sentiment_analyzed") is True:
+            settled.add(doc["_id"])
+            continue
+        # Documents leased by a running worker are left to it
+        written_ids.append(doc["_id"])
+        ops.append(UpdateOne(
+            {"_id": doc["_id"], "$or": [{"claim_expires_at": None}, {"claim_expires_at": {"$lt": now}}]},
+            {"$set": {"priority": new_priority, "priority_updated_at": now, "sentiment_analyzed": True}}
+        ))
+    if not ops:
+        return 0, 0, settled
+
+    try:
+        modified, failed = collection.bulk_write(ops, ordered=False).modified_count, 0
+    except BulkWriteError as bwe:
+        for err in bwe.details.get("writeErrors", [])[:5]:
+            logger.error(f"Failed to update {collection.name}: {err.get('errmsg')}")
+        modified, failed = bwe.details.get("nModified", 0), len(bwe.details.get("writeErrors", []))
+    if modified == len(ops):
+        settled.update(written_ids)
+    elif modified:
+        # Per-operation results are not reported: leased or failed documents do not carry this write's timestamp
+        settled.update(doc["_id"] for doc in collection.find(
+            {"_id": {"$in": written_ids}, "priority_updated_at": now}, {"_id": 1}
+        ))
+    return modified, failed, settled
+
+def cache_chunk(redis_client, prefix: str, docs, priorities, settled):
+    """Refresh the worker's per-document priority cache for the settled documents of a chunk"""
+    if not redis_client or not settled:
+        return
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for doc, new_priority in zip(docs, priorities):
+            if doc["_id"] in settled:
+                pipe.setex(f"{prefix}:{doc['_id']}", PRIORITY_CACHE_TTL, new_priority)
+        pipe.execute()
+    except Exception as e:
+        logger.debug(f"Redis cache refresh skipped: {e}")
+
+def reclassify_collection(collection, query, args, checkpoint, limiter, redis_client):
+    """Page one collection by _id from its checkpoint to the end"""
+    fields, prefix, normalize = COLLECTIONS[collection.name]
+    _, link_field, _ = LINKS[collection.name]
+    projection = {field: 1 for field in fields + ("priority", "sentiment_analyzed", link_field)}
+    # Like the worker, --pending-only only pairs with partners that are still pending
+    partner_query = {"sentiment_analyzed": {"$ne": True}} if args.pending_only else None
+    state = checkpoint.setdefault(collection.name, {"last_id": None, "seen": 0, "modified": 0, "failed": 0})
+    transitions = Counter()
+
+    if state.get("done"):
+        logger.info(f"[{collection.name}] Already complete in checkpoint - skipping")
+        return transitions
+
+    while True:
+        page_query = dict(query)
+        if state["last_id"]:
+            page_query["_id"] = {"$gt": ObjectId(state["last_id"])}
+        docs = list(collection.find(page_query, projection).sort("_id", pymongo.ASCENDING).limit(args.chunk))
+        if not docs:
+            break
+
+        partners = load_partners(collection, docs, partner_query)
+        priorities = classify_docs(docs, fields, normalize, collection.name, partners)
+        if args.dry_run:
+            settled = {doc["_id"] for doc in docs}
+        else:
+            modified, failed, settled = write_chunk(collection, docs, priorities)
+            cache_chunk(redis_client, prefix, docs, priorities, settled)
+            state["modified"] += modified
+            state["failed"] += failed
+        # Leased or failed documents kept their old priority
+        for doc, new_priority in zip(docs, priorities):
+            if doc["_id"] in settled:
+                transitions[(doc.get("priority"), new_priority)] += 1
+
+        state["seen"] += len(docs)
+        state["last_id"] = str(docs[-1]["_id"])
+        if not args.dry_run:
+            save_checkpoint(args.checkpoint, checkpoint)
+
+        logger.info(f"[{collection.name}] {state['seen']} scanned | {state['modified']} modified | "
+                    f"{state['failed']} failed | last _id {state['last_id']}")
+        limiter.wait(len(docs))
+
+    state["done"] = True
+    if not args.dry_run:
+        save_checkpoint(args.checkpoint, checkpoint)
+    return transitions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--collection", choices=["emails", "tickets", "both"], default="both")
+    parser.add_argument("--since", type=parse_date, help="createdAt on or after (YYYY-MM-DD)")
+    parser.add_argument("--until", type=parse_date, help="createdAt before (YYYY-MM-DD)")
+    parser.add_argument("--mailbox", help="EmailQueue id, name or username (emails only)")
+    parser.add_argument("--pending-only", action="store_true", help="skip documents already analyzed")
+    parser.add_argument("--chunk", type=int, default=500, help="documents per page and bulk write")
+    parser.add_argument("--rate", type=float, default=0, help="max documents per second (0 = unlimited)")
+    parser.add_argument("--dry-run", action="store_true", help="classify and report, write nothing")
+    parser.add_argument("--checkpoint", default="logs/reclassify_checkpoint.json")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    parser.add_argument("--mongo-uri", default=MONGO_URI)
+    parser.add_argument("--redis-url", default=REDIS_URL)
+    args = parser.parse_args()
+
+    try:
+        mongo_client, db = connect_mongo(args.mongo_uri)
+    except Exception as e:
+        sys.exit(f"Failed to connect to MongoDB: {e}")
+    redis_client = None if args.dry_run else connect_redis(args.redis_url)
+
+    names = {"emails": ["emailmessages"], "tickets": ["tickets"], "both": ["emailmessages", "tickets"]}[args.collection]
+    if args.mailbox and "tickets" in names:
+        # Tickets carry no mailbox; they are only selectable by date
+        logger.info("--mailbox given: tickets are left out")
+        names.remove("tickets")
+    mailbox_id = resolve_mailbox(db, args.mailbox) if args.mailbox else None
+
+    os.makedirs(os.path.dirname(args.checkpoint) or ".", exist_ok=True)
+    signature = filter_signature(args)
+    checkpoint = {} if args.restart else load_checkpoint(args.checkpoint, signature)
+    checkpoint["signature"] = signature
+
+    logger.info(f"Reclassifying {', '.join(names)} | classifier {classifier.classifier_version()} | "
+                f"chunk {args.chunk} | rate {args.rate or 'unlimited'}{' | DRY RUN' if args.dry_run else ''}")
+
+    limiter = RateLimiter(args.rate)
+    try:
+        for name in names:
+            query = build_filter(args, mailbox_id if name == "emailmessages" else None)
+            transitions = reclassify_collection(db[name], query, args, checkpoint, limiter, redis_client)
+            for (old_priority, new_priority), count in sorted(transitions.items(), key=lambda item: -item[1]):
+                logger.info(f"[{name}] {old_priority} -> {new_priority}: {count}")
+
+        # Worker priority counters are rebuilt from the collections on their next read
+        if redis_client:
+            redis_client.delete(*[f"priority_counts:{name}" for name in names])
+        # A finished run has nothing to resume
+        if not args.dry_run and os.path.exists(args.checkpoint):
+            os.remove(args.checkpoint)
+    except KeyboardInterrupt:
+        logger.info(f"Interrupted - rerun the same command to resume from {args.checkpoint}")
+        return 1
+    finally:
+        mongo_client.close()
+
+    elapsed = time.monotonic() - limiter.start_time
+    logger.info(f"Done: {limiter.count} documents in {elapsed:.1f}s ({limiter.count / max(elapsed, 1e-9):.1f} docs/sec)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Sentiment Engines
+Pluggable polarity/subjectivity scorers used by detect_priority when no
+keyword tier matches. Engines score a whole batch of texts per call.
+
+Engines:
+  textblob - TextBlob's pattern analyzer, one document at a time (reference)
+  lexicon  - the same pattern lexicon applied to the whole batch with NumPy
+"""
+
+import os
+import re
+import hashlib
+import logging
+import xml.etree.ElementTree as ElementTree
+from abc import ABC, abstractmethod
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+SENTIMENT_ENGINE = os.environ.get("EMAIL_WORKER_SENTIMENT_ENGINE", "textblob").lower()
+
+# Polarity thresholds shared by every engine
+CRITICAL_POLARITY = -0.4
+HIGH_POLARITY = -0.2
+ANGRY_POLARITY = -0.1
+ANGRY_SUBJECTIVITY = 0.8
+MEDIUM_POLARITY = -0.05
+THRESHOLDS = (CRITICAL_POLARITY, HIGH_POLARITY, ANGRY_POLARITY, MEDIUM_POLARITY)
+# Part of the classification cache key, changes whenever a threshold does
+THRESHOLDS_VERSION = hashlib.sha1(repr(THRESHOLDS + (ANGRY_SUBJECTIVITY,)).encode()).hexdigest()[:8]
+
+def priority_from_sentiment(polarity: float, subjectivity: float) -> str:
+    """Map polarity/subjectivity to critical, high, medium or low"""
+    # Critical: extremely negative sentiment
+    if polarity < CRITICAL_POLARITY:
+        return 'critical'
+    # High: very negative sentiment or high subjectivity (angry complaints)
+    if polarity < HIGH_POLARITY or (polarity < ANGRY_POLARITY and subjectivity > ANGRY_SUBJECTIVITY):
+        return 'high'
+    # Medium: negative sentiment
+    if polarity < MEDIUM_POLARITY:
+        return 'medium'
+    # Low: neutral or positive
+    return 'low'
+
+class SentimentEngine(ABC):
+    """Scores a batch of lowercased texts as (polarity, subjectivity) pairs"""
+
+    name = "base"
+
+    @abstractmethod
+    def score_batch(self, texts: List[str]) -> List[Tuple[float, float]]:
+        """One (polarity, subjectivity) pair per text, in order"""
+
+class TextBlobEngine(SentimentEngine):
+    """TextBlob pattern analyzer, one document at a time"""
+
+    name = "textblob"
+
+    def __init__(self):
+        # Imported here so that loading this module stays cheap
+        from textblob import TextBlob
+        self.TextBlob = TextBlob
+
+    def score_batch(self, texts: List[str]) -> List[Tuple[float, float]]:
+        scores = []
+        for text in texts:
+            sentiment = self.TextBlob(text).sentiment
+            scores.append((sentiment.polarity, sentiment.subjectivity))
+        return scores
+
+class LexiconEngine(SentimentEngine):
+    """
+    Vectorized scorer over TextBlob's pattern lexicon (en-sentiment.xml).
+
+    The batch is tokenized once; token scores are looked up per unique token
+    and averaged per document with NumPy. Negation ("not good" = -0.5 * good),
+    a single preceding intensifier ("very bad") and "!" boosts follow pattern's
+    rules, including retention across short words. Emoticons, pattern's
+    tokenizer edge cases and negation/modifier chains are not modelled; a chain
+    like "not really very bad" can even flip the sign of the polarity.
+
+    Tolerance: documents whose polarity lands within `tolerance` (default 0.05)
+    of a priority threshold are rescored with TextBlob. This only catches small
+    errors; the priority still differs from the textblob engine whenever the
+    approximation error exceeds the band. check_sentiment.py reports how often
+    that happens on a fixed seeded corpus.
+    """
+
+    name = "lexicon"
+
+    # Contractions stay one token, as in pattern: "isn't" does not negate
+    NEGATIONS = ("no", "not", "never")
+    TOKEN_RE = re.compile(r"[a-z]+(?:'[a-z]+)?|!")
+
+    def __init__(self, lexicon_path: str = None, tolerance: float = None):
+        import numpy as np
+        self.np = np
+        
+        if lexicon_path is None:
+            lexicon_path = os.environ.get("EMAIL_WORKER_SENTIMENT_LEXICON") or self.default_lexicon_path()
+        if tolerance is None:
+            tolerance = float(os.environ.get("EMAIL_WORKER_SENTIMENT_TOLERANCE", "0.05"))
+        self.tolerance = tolerance
+        self.fallback = TextBlobEngine()
+        self.load(lexicon_path)
+
+    @staticmethod
+    def default_lexicon_path() -> str:
+        import textblob
+        return os.path.join(os.path.dirname(textblob.__file__), "en", "en-sentiment.xml")
+
+    def load(self, path: str):
+        """Average every sense of a word into one (polarity, subjectivity, intensity) row"""
+        np = self.np
+        senses = {}
+        modifiers = set()
+        for word in ElementTree.parse(path).getroot().findall("word"):
+            form = word.attrib.get("form")
+            if not form:
+                continue
+            senses.setdefault(form, {}).setdefault(word.attrib.get("pos"), []).append((
+                float(word.attrib.get("polarity", 0.0)),
+                float(word.attrib.get("subjectivity", 0.0)),
+                float(word.attrib.get("intensity", 1.0))
+            ))
+        
+        # Pattern averages senses per part of speech, then across parts of speech
+        scores = {}
+        for form, by_pos in senses.items():
+            per_pos = {pos: np.mean(values, axis=0) for pos, values in by_pos.items()}
+            scores[form] = np.mean(list(per_pos.values()), axis=0)
+            if "RB" in per_pos:
+                modifiers.add(form)
+        
+        # Like TextBlob, derive adverbs from adjectives ("terrible" -> "terribly")
+        for form, by_pos in senses.items():
+            if "JJ" in by_pos:
+                stem = form[:-1] + "i" if form.endswith("y") else form
+                stem = stem[:-2] if stem.endswith("le") else stem
+                scores[stem + "ly"] = np.mean(by_pos["JJ"], axis=0)
+                modifiers.add(stem + "ly")
+        
+        self.vocab = {form: i for i, form in enumerate(scores)}
+        table = np.array(list(scores.values()), dtype=np.float64).reshape(-1, 3)
+        self.polarity = table[:, 0]
+        self.subjectivity = table[:, 1]
+        self.intensity = table[:, 2]
+        self.is_modifier = np.array([form in modifiers for form in self.vocab], dtype=bool)
+        logger.debug(f"Sentiment lexicon loaded: {len(self.vocab)} words from {path}")
+
+    def score_batch(self, texts: List[str]) -> List[Tuple[float, float]]:
+        np = self.np
+        if not texts:
+            return []
+        
+        # 1. Tokenize the whole batch into one flat token array with document ids
+        token_lists = [self.TOKEN_RE.findall(text) for text in texts]
+        lengths = np.fromiter((len(tokens) for tokens in token_lists), dtype=np.int64, count=len(texts))
+        flat = [token for tokens in token_lists for token in tokens]
+        if not flat:
+            return [(0.0, 0.0)] * len(texts)
+        size = len(flat)
+        positions = np.arange(size)
+        doc_ids = np.repeat(np.arange(len(texts)), lengths)
+        
+        # 2. Look up each unique token once
+        unique, inverse = np.unique(np.array(flat, dtype=object), return_inverse=True)
+        unique_ids = np.fromiter((self.vocab.get(token, -1) for token in unique), dtype=np.int64, count=len(unique))
+        unique_negation = np.fromiter((token in self.NEGATIONS for token in unique), dtype=bool, count=len(unique))
+        unique_length = np.fromiter((len(token.strip("'")) for token in unique), dtype=np.int64, count=len(unique))
+        lex_ids = unique_ids[inverse]
+        is_negation = unique_negation[inverse]
+        token_length = unique_length[inverse]
+        unique_ly = np.fromiter((token.endswith("ly") for token in unique), dtype=bool, count=len(unique))
+        is_bang = (unique == "!")[inverse]
+        
+        known = lex_ids >= 0
+        safe_ids = np.where(known, lex_ids, 0)
+        polarity = np.where(known, self.polarity[safe_ids], 0.0)
+        subjectivity = np.where(known, self.subjectivity[safe_ids], 0.0)
+        intensity = np.where(known, self.intensity[safe_ids], 1.0)
+        is_modifier = known & self.is_modifier[safe_ids]
+        is_ly_modifier = is_modifier & unique_ly[inverse]
+        
+        def previous(keep):
+            """Index of the nearest earlier token in the same document that is not skipped"""
+            anchor = np.full(size, -1)
+            anchor[1:] = np.maximum.accumulate(np.where(keep, positions, -1))[:-1]
+            valid = anchor >= 0
+            valid[valid] = doc_ids[anchor[valid]] == doc_ids[valid]
+            return np.where(valid, anchor, -1)
+        
+        # 3. Negation reaches across one-letter words ("not a good"),
+        #    modifiers across words of up to two letters ("really is a good")
+        neg_anchor = previous(known | (token_length > 1) | is_negation)
+        negated = (neg_anchor >= 0) & is_negation[np.maximum(neg_anchor, 0)]
+        mod_anchor = previous(known | (token_length > 2))
+        modified = (mod_anchor >= 0) & is_modifier[np.maximum(mod_anchor, 0)]
+        
+        # An "-ly" modifier absorbs a following negation ("terribly not good")
+        ly_anchor = previous(known | ((token_length > 2) & ~is_negation))
+        ly_anchor_ok = ly_anchor >= 0
+        ly_anchor_ok[ly_anchor_ok] = is_ly_modifier[ly_anchor[ly_anchor_ok]]
+        absorbed = is_negation & ~known & ly_anchor_ok
+        negated &= ~absorbed[np.maximum(neg_anchor, 0)] | (neg_anchor < 0)
+        merged = known & (modified | ly_anchor_ok)
+        
+        # 4. "very bad": the modifier's assessment is replaced by the scaled word;
+        #    a negated modifier inverts its intensity ("not very good")
+        source = np.where(modified, mod_anchor, ly_anchor)[merged]
+        factor = np.where(negated[source], 1.0 / intensity[source], intensity[source])
+        polarity[merged] = np.clip(polarity[merged] * factor, -1.0, 1.0)
+        subjectivity[merged] = np.clip(subjectivity[merged] * factor, -1.0, 1.0)
+        modifier_negated = negated.copy()
+        modifier_negated[ly_anchor[absorbed]] = True
+        negated[merged] |= modifier_negated[source]
+        assessed = known.copy()
+        assessed[source] = False
+        
+        # 5. Each "!" boosts the latest assessment before it
+        last_assessed = previous(assessed)
+        boosted = last_assessed[is_bang & (last_assessed >= 0)]
+        if len(boosted):
+            boosts = np.bincount(boosted, minlength=size)
+            polarity = np.clip(polarity * 1.25 ** boosts, -1.0, 1.0)
+        
+        # 6. "not good" = slightly bad, "not bad" = slightly good
+        polarity = np.where(negated, polarity * -0.5, polarity)
+        
+        # 7. Average assessments per document
+        counts = np.bincount(doc_ids[assessed], minlength=len(texts))
+        pol_sum = np.bincount(doc_ids[assessed], weights=polarity[assessed], minlength=len(texts))
+        subj_sum = np.bincount(doc_ids[assessed], weights=subjectivity[assessed], minlength=len(texts))
+        divisor = np.maximum(counts, 1)
+        pol_mean = pol_sum / divisor
+        subj_mean = subj_sum / divisor
+        
+        # 8. Rescore documents close to a threshold with the reference engine
+        near = np.zeros(len(texts), dtype=bool)
+        for threshold in THRESHOLDS:
+            near |= np.abs(pol_mean - threshold) < self.tolerance
+        scores = list(zip(pol_mean.tolist(), subj_mean.tolist()))
+        for i in np.flatnonzero(near).tolist():
+            scores[i] = self.fallback.score_batch([texts[i]])[0]
+        return scores
+
+ENGINES = {
+    "textblob": TextBlobEngine,
+    "lexicon": LexiconEngine,
+}
+
+def get_engine(name: str = SENTIMENT_ENGINE) -> SentimentEngine:
+    """Create the sentiment engine selected by name"""
+    if name not in ENGINES:
+        raise ValueError(f"Unknown sentiment engine '{name}' (choose from {', '.join(ENGINES)})")
+    return ENGINES[name]()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Email Body Normalizer
+Reduces an IMAP body to the newest message text before classification:
+HTML markup, quoted reply history, signatures and disclaimers are dropped
+and the result is capped at a character budget. Lines are consumed
+lazily, so the work per message stops once the budget or the start of
+the quoted history is reached.
+"""
+
+import os
+import re
+import html
+from typing import Iterator
+
+# Characters of body text passed on to keyword and sentiment analysis
+MAX_BODY_CHARS = int(os.environ.get("EMAIL_WORKER_MAX_BODY_CHARS", "2000"))
+# Markup inflates HTML bodies; raw characters scanned per budget character
+HTML_SCAN_FACTOR = 8
+
+HTML_HINT_RE = re.compile(r"<(?:html|body|div|p|br|table|span|blockquote|style)\b", re.IGNORECASE)
+# Whole elements whose content is never message text (or is quoted history)
+HTML_DROP_RE = re.compile(
+    r"<(style|script|head|blockquote)\b.*?(?:</\1\s*>|\Z)"
+    r"|<div[^>]*class=[\"'][^\"']*(?:gmail_quote|moz-cite-prefix|OutlookMessageHeader)[^\"']*[\"'].*\Z",
+    re.IGNORECASE | re.DOTALL
+)
+HTML_BREAK_RE = re.compile(r"<(?:br|/p|/div|/tr|/li|/h[1-6])\b[^>]*>", re.IGNORECASE)
+HTML_TAG_RE = re.compile(r"<[^>]*>")
+
+# Lines where the quoted history of a reply starts
+REPLY_HEADER_RE = re.compile(
+    r"^(?:on\b.{0,200}\bwrote:"
+    r"|-{2,}\s*(?:original message|forwarded message)\s*-{2,}"
+    r"|_{5,})$",
+    re.IGNORECASE
+)
+# Outlook header blocks: "From:" only starts one when the next line is another header
+OUTLOOK_FROM_RE = re.compile(r"^from:\s.+$", re.IGNORECASE)
+OUTLOOK_NEXT_RE = re.compile(r"^(?:sent|date|to):\s", re.IGNORECASE)
+# Lines where the signature or a disclaimer starts
+SIGNATURE_RE = re.compile(
+    r"^(?:--\s?"
+    r"|sent from my \w+.*"
+    r"|(?:best|kind|warm|many)?\s*(?:regards|wishes),?"
+    r"|(?:thanks|thank you|cheers|sincerely|best),?"
+    r"|(?:confidentiality notice|disclaimer)\b.*"
+    r"|this (?:e-?mail|message) and any attachments\b.*)$",
+    re.IGNORECASE
+)
+
+def html_to_text(body: str) -> str:
+    """Markup-free text of an HTML body, without quoted blocks"""
+    text = HTML_DROP_RE.sub(" ", body)
+    text = HTML_BREAK_RE.sub("\n", text)
+    return html.unescape(HTML_TAG_RE.sub(" ", text))
+
+def iter_lines(text: str) -> Iterator[str]:
+    """Lines of text without splitting the whole string up front"""
+    start = 0
+    while start < len(text):
+        end = text.find("\n", start)
+        if end == -1:
+            end = len(text)
+        yield text[start:end]
+        start = end + 1
+
+def normalize_body(body: str, budget: int = MAX_BODY_CHARS) -> str:
+    """Newest message text of an email body, at most `budget` characters"""
+    if not body:
+        return ""
+    if HTML_HINT_RE.search(body, 0, 4096):
+        body = html_to_text(body[:budget * HTML_SCAN_FACTOR])
+
+    kept = []
+    size = 0
+    held = None
+    for line in iter_lines(body):
+        stripped = line.strip()
+        if not stripped:
+            continue
+        if stripped.startswith(">"):
+            continue
+        if held is not None:
+            if OUTLOOK_NEXT_RE.match(stripped):
+                held = None
+                break
+            # Not a header block after all: "From:" was message text
+            kept.append(held)
+            size += len(held) + 1
+            held = None
+            if size >= budget:
+                break
+        # Everything after the first reply header or signature is history/boilerplate,
+        # but a sign-off on the very first line is the message itself ("Thanks!")
+        if REPLY_HEADER_RE.match(stripped) or (kept and SIGNATURE_RE.match(stripped)):
+            break
+        if OUTLOOK_FROM_RE.match(stripped):
+            held = stripped
+            continue
+        kept.append(stripped)
+        size += len(stripped) + 1
+        if size >= budget:
+            break
+    if held is not None:
+        kept.append(held)
+
+    return " ".join(kept)[:budget]
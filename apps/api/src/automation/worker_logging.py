@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Worker Logging
+Log records are handed to a queue and written by a background listener
+thread, so the processing loop never waits on stdout or the log file.
+Output is plain text or one JSON object per line, the file is rotated by
+size, and per-document records are sampled. Classification pool processes
+log through a multiprocessing queue drained by a second listener, since
+the in-process queue and its thread do not survive the fork.
+"""
+
+import os
+import sys
+import json
+import queue
+import random
+import atexit
+import logging
+import logging.handlers
+import multiprocessing
+from datetime import datetime, timezone
+
+LOG_FORMAT = os.environ.get("EMAIL_WORKER_LOG_FORMAT", "text").lower()
+LOG_LEVEL = os.environ.get("EMAIL_WORKER_LOG_LEVEL", "INFO").upper()
+LOG_FILE = os.environ.get("EMAIL_WORKER_LOG_FILE", os.path.join("logs", "email_worker.log"))
+LOG_MAX_BYTES = int(os.environ.get("EMAIL_WORKER_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUPS = int(os.environ.get("EMAIL_WORKER_LOG_BACKUPS", "5"))
+# Fraction of per-document records written (batch summaries are always written)
+DOC_LOG_SAMPLE = float(os.environ.get("EMAIL_WORKER_LOG_SAMPLE", "0.01"))
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else came in through `extra`
+STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with `extra` fields at the top level"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in STANDARD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def sample_document() -> bool:
+    """Whether this document's per-document records should be written"""
+    return DOC_LOG_SAMPLE >= 1 or random.random() < DOC_LOG_SAMPLE
+
+_listener = None
+_pool_queue = None
+_pool_listener = None
+
+def setup_logging(log_format: str = LOG_FORMAT, log_file: str = LOG_FILE):
+    """
+    Route every record through a QueueHandler to a listener thread that owns
+    the rotating file and stdout handlers
+    """
+    global _listener
+    stop_logging()
+
+    log_dir = os.path.dirname(log_file)
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+
+    formatter = JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT)
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding='utf-8'
+    )
+    stream_handler = logging.StreamHandler(sys.stdout)
+    for handler in (file_handler, stream_handler):
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(LOG_LEVEL)
+
+    _listener = logging.handlers.QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+def pool_log_queue():
+    """
+    Queue for classification pool processes (see log_to_queue), drained into
+    the worker's file and stdout handlers by its own listener thread; None
+    when logging is not set up
+    """
+    global _pool_queue, _pool_listener
+    if _listener is None:
+        return None
+    if _pool_queue is None:
+        _pool_queue = multiprocessing.Queue()
+        _pool_listener = logging.handlers.QueueListener(_pool_queue, *_listener.handlers, respect_handler_level=True)
+        _pool_listener.start()
+    return _pool_queue
+
+def log_to_queue(log_queue, level: str = LOG_LEVEL):
+    """
+    Pool process initializer step: replace the handlers inherited from the
+    worker, whose queue nobody reads in this process, with one feeding log_queue
+    """
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+
+def stop_logging():
+    """Flush queued records and stop the listener threads"""
+    global _listener, _pool_queue, _pool_listener
+    if _pool_listener is not None:
+        _pool_listener.stop()
+        _pool_queue.close()
+        _pool_listener = None
+        _pool_queue = None
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
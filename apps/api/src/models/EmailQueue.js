@@ -48,6 +48,8 @@ hostname: {
   isDeleted: { type: Boolean, default: false },
   // NEW: Priority for queue selection
   priority: { type: Number, default: 0 }, // Higher number = higher priority
+  // Share of the priority classifier's capacity relative to other mailboxes (0 = only spare capacity)
+  classificationWeight: { type: Number, default: 1, min: 0 },
   // NEW: Rate limiting for sending/receiving
   maxEmailsPerHour: { type: Number, default: 100 },
   // NEW: Health status tracking
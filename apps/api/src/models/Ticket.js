@@ -45,7 +45,9 @@ const ticketSchema = new mongoose.Schema(
       type: mongoose.Schema.Types.ObjectId, 
       ref: 'EmailMessage',
       default: null 
-    }
+    },
+    // Normalized title the Python worker uses to match emails to tickets
+    titleMatchKey: { type: String }
   },
   { timestamps: true }
 );
@@ -53,6 +55,19 @@ const ticketSchema = new mongoose.Schema(
 // Add indexes for efficient queries
 ticketSchema.index({ priority: 1, sentiment_analyzed: 1 });
 ticketSchema.index({ email: 1, title: 1 });
+ticketSchema.index({ email: 1, titleMatchKey: 1, priority: 1 });
+
+// Keep in sync with title_match_key() in automation/email_worker.py
+function titleMatchKey(title) {
+  const key = String(title || '')
+    .split(/\s+/)
+    .filter(Boolean)
+    .join(' ')
+    .toLowerCase()
+    .replace(/^(?:(?:re|ref|fwd?)\s*:\s*)+/, '');
+  // Slice by code point like Python does
+  return Array.from(key).slice(0, 50).join('');
+}
 
 ticketSchema.pre('validate', async function(next) {
   if (!this.number) {
@@ -66,4 +81,20 @@ ticketSchema.pre('validate', async function(next) {
   next();
 });
 
+ticketSchema.pre('save', function(next) {
+  if (this.isModified('title') || this.titleMatchKey === undefined) {
+    this.titleMatchKey = titleMatchKey(this.title);
+  }
+  next();
+});
+
+ticketSchema.pre('findOneAndUpdate', function(next) {
+  const update = this.getUpdate() || {};
+  const title = update.$set && update.$set.title !== undefined ? update.$set.title : update.title;
+  if (title !== undefined) {
+    this.set({ titleMatchKey: titleMatchKey(title) });
+  }
+  next();
+});
+
 module.exports = mongoose.models.Ticket || mongoose.model('Ticket', ticketSchema);
\ No newline at end of file